@@ -1,6 +1,13 @@
+import logging
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
+
+from config.metrics import (TaskRun, current_run, get_process_name,
+                            publish_metrics, task_seconds)
+
+logger = logging.getLogger(__name__)
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -13,5 +20,40 @@ app = Celery("config")
 #   should have a `CELERY_` prefix.
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
+# Celery's Django fixup calls close_if_unusable_or_obsolete() on every
+# connection before and after each task, so workers reuse connections for
+# CONN_MAX_AGE seconds, health-check them before each task and drop broken
+# ones, exactly like web requests.
+
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+# Runs of the tasks in progress in this process, by task id
+task_runs = {}
+
+
+@task_prerun.connect
+def start_task_run(task_id=None, **kwargs):
+    run = TaskRun()
+    task_runs[task_id] = (run, current_run.set(run))
+
+
+@task_postrun.connect
+def finish_task_run(task_id=None, task=None, state=None, **kwargs):
+    """Records how long the task took, logs what it did and, in a worker,
+    shares the metrics with the web tier."""
+    if task_id not in task_runs:
+        return
+    run, token = task_runs.pop(task_id)
+    current_run.reset(token)
+    task_seconds.observe((task.name, state), run.duration)
+    logger.info(
+        "Task %s %s in %.0f ms: %s",
+        task.name,
+        state,
+        run.duration * 1000,
+        ", ".join(f"{name}={count}" for name, count in sorted(run.counts.items()))
+        or "nothing counted",
+    )
+    if not task.request.is_eager:
+        publish_metrics(get_process_name())
@@ -0,0 +1,31 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from config.metrics import connection_stats
+
+
+class MeteredDatabaseWrapperMixin:
+    """Records in `connection_stats` when a connection is opened, closed or
+    dropped after a failed health check, and how long opening it took."""
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        connection_stats.record_connect(self.alias, time.perf_counter() - started)
+
+    def close(self):
+        was_open = self.connection is not None
+        super().close()
+        if was_open and self.connection is None:
+            connection_stats.record_close(self.alias)
+
+    def close_if_health_check_failed(self):
+        was_open = self.connection is not None
+        super().close_if_health_check_failed()
+        if was_open and self.connection is None:
+            connection_stats.record_recycle(self.alias)
+
+
+class DatabaseWrapper(MeteredDatabaseWrapperMixin, base.DatabaseWrapper):
+    """The PostgreSQL backend with connection metrics."""
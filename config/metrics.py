@@ -0,0 +1,425 @@
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Upper bounds of the query count histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Cache keys listing the Celery workers and the web processes that
+# published their metrics
+WORKERS_KEY = "metrics:workers"
+PROCESSES_KEY = "metrics:processes"
+PUBLISHERS_KEYS = {"worker": WORKERS_KEY, "process": PROCESSES_KEY}
+
+
+class Histogram:
+    """Counts observations into buckets with fixed upper bounds, the way
+    Prometheus histograms do, so they can be summed across processes."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last count is of observations above the highest bound.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """Returns the cumulative count of every bucket, plus the total count
+        and sum."""
+        with self.lock:
+            counts, total = [], 0
+            for count in self.counts:
+                total += count
+                counts.append(total)
+            return {
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+                "count": total,
+                "sum": round(self.sum, 6),
+            }
+
+
+# Every metric family of this process, in the order they are exposed
+REGISTRY = []
+
+
+class MetricVec:
+    """A named Prometheus metric family with one value per label values,
+    registered in REGISTRY."""
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def snapshot(self):
+        """Returns the current value of every label values."""
+        raise NotImplementedError
+
+    def expose(self, samples=None):
+        """Renders `samples`, `(labels, value)` pairs, or this process's
+        values in the Prometheus text format."""
+        if samples is None:
+            samples = [
+                (dict(zip(self.labels, values)), value)
+                for values, value in sorted(self.snapshot().items())
+            ]
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for labels, value in samples:
+            if self.type == "histogram":
+                lines += format_histogram(self.name, labels, value)
+            else:
+                lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class CounterVec(MetricVec):
+    """Counters; increments made while a Celery task runs also go to the
+    counts of that task's run."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def inc(self, values=(), amount=1):
+        with self.lock:
+            self.counts[tuple(values)] += amount
+        run = current_run.get()
+        if run is not None:
+            run.counts[
+                self.name + format_labels(dict(zip(self.labels, values)))
+            ] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class HistogramVec(MetricVec):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.histograms = defaultdict(lambda: Histogram(buckets))
+
+    def observe(self, values, value):
+        self.histograms[tuple(values)].observe(value)
+
+    def snapshot(self):
+        return {
+            values: histogram.snapshot()
+            for values, histogram in self.histograms.copy().items()
+        }
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_histogram(name, labels, snapshot):
+    """Renders a `Histogram.snapshot()` in the Prometheus text format."""
+    lines = [
+        f"{name}_bucket{format_labels({**labels, 'le': bound})} {count}"
+        for bound, count in snapshot["buckets"].items()
+    ]
+    lines.append(f"{name}_sum{format_labels(labels)} {snapshot['sum']}")
+    lines.append(f"{name}_count{format_labels(labels)} {snapshot['count']}")
+    return lines
+
+
+class ConnectionStats:
+    """Database connections this process opened, closed and recycled after
+    a failed health check, per alias, and the time opening them took."""
+
+    def __init__(self):
+        self.opened = Counter()
+        self.closed = Counter()
+        self.recycled = Counter()
+        self.connect_seconds = defaultdict(Histogram)
+        self.lock = threading.Lock()
+
+    def record_connect(self, alias, seconds):
+        with self.lock:
+            self.opened[alias] += 1
+        self.connect_seconds[alias].observe(seconds)
+
+    def record_close(self, alias):
+        with self.lock:
+            self.closed[alias] += 1
+
+    def record_recycle(self, alias):
+        with self.lock:
+            self.recycled[alias] += 1
+
+    def snapshot(self):
+        return {
+            alias: {
+                "opened": self.opened[alias],
+                "closed": self.closed[alias],
+                "open": self.opened[alias] - self.closed[alias],
+                "recycled": self.recycled[alias],
+                "connect_seconds": self.connect_seconds[alias].snapshot(),
+            }
+            for alias in list(self.opened)
+        }
+
+    def expose(self, labels=None):
+        snapshot = self.snapshot()
+        labels = labels or {}
+        lines = []
+        for name, documentation in [
+            ("opened", "Database connections opened."),
+            ("closed", "Database connections closed."),
+            ("recycled", "Database connections dropped after a failed health check."),
+        ]:
+            lines += [
+                f"# HELP db_connections_{name}_total {documentation}",
+                f"# TYPE db_connections_{name}_total counter",
+            ]
+            lines += [
+                f"db_connections_{name}_total"
+                f"{format_labels({**labels, 'alias': alias})} "
+                f"{stats[name]}"
+                for alias, stats in snapshot.items()
+            ]
+        lines += [
+            "# HELP db_connect_seconds Time taken to open a database connection.",
+            "# TYPE db_connect_seconds histogram",
+        ]
+        for alias, stats in snapshot.items():
+            lines += format_histogram(
+                "db_connect_seconds",
+                {**labels, "alias": alias},
+                stats["connect_seconds"],
+            )
+        return lines
+
+
+connection_stats = ConnectionStats()
+
+
+def get_server_connections(alias=DEFAULT_DB_ALIAS):
+    """Returns max_connections and the connections to the database by state
+    across all processes, on PostgreSQL; None elsewhere."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW max_connections")
+        (max_connections,) = cursor.fetchone()
+        cursor.execute(
+            "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() GROUP BY 1"
+        )
+        states = dict(cursor.fetchall())
+    return {"max_connections": int(max_connections), "connections": states}
+
+
+class RequestTimings:
+    """Where the time of one request went, in seconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+# The timings of the request being handled; context variables follow the
+# request into the threads async views run their queries in.
+current_timings = ContextVar("current_timings", default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db += time.perf_counter() - started
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timer)
+
+REQUEST_LABELS = ("view", "method")
+request_seconds = HistogramVec(
+    "http_request_duration_seconds", "Time taken to answer requests.", REQUEST_LABELS
+)
+request_db_seconds = HistogramVec(
+    "http_request_db_seconds", "Time requests spent on SQL queries.", REQUEST_LABELS
+)
+request_queries = HistogramVec(
+    "http_request_db_queries",
+    "SQL queries run per request.",
+    REQUEST_LABELS,
+    buckets=QUERY_COUNT_BUCKETS,
+)
+request_serialize_seconds = HistogramVec(
+    "http_request_serialize_seconds",
+    "Time requests spent rendering their response body.",
+    REQUEST_LABELS,
+)
+
+
+def record_request(labels, timings, total):
+    request_seconds.observe(labels, total)
+    request_db_seconds.observe(labels, timings.db)
+    request_queries.observe(labels, timings.queries)
+    request_serialize_seconds.observe(labels, timings.serialize)
+
+
+class TaskRun:
+    """The counts a Celery task added to the metrics while it ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts = Counter()
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+
+current_run = ContextVar("current_run", default=None)
+
+task_seconds = HistogramVec(
+    "celery_task_duration_seconds",
+    "Time taken to run Celery tasks, by task and final state.",
+    ("task", "state"),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+
+
+def get_process_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_published_key(label, name):
+    return f"metrics:{label}:{name}"
+
+
+def get_worker_key(worker):
+    return get_published_key("worker", worker)
+
+
+def publish_metrics(name, label="worker"):
+    """Shares the metrics of this process with the web tier through the
+    cache, for WORKER_METRICS_TTL seconds, under `label`: `worker` for
+    Celery workers and `process` for web processes.
+
+    Publishers are listed under PUBLISHERS_KEYS[label]; two joining at once
+    may drop one another from the list until their next publication.
+    """
+    cache.set(
+        get_published_key(label, name),
+        {family.name: family.snapshot() for family in REGISTRY},
+        timeout=settings.WORKER_METRICS_TTL,
+    )
+    publishers = cache.get(PUBLISHERS_KEYS[label], set())
+    if name not in publishers:
+        cache.set(PUBLISHERS_KEYS[label], publishers | {name}, timeout=None)
+
+
+class ThrottledPublisher:
+    """Publishes the metrics of a web process after a request at most every
+    METRICS_PUBLISH_INTERVAL seconds."""
+
+    def __init__(self):
+        self.published = None
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        now = time.monotonic()
+        with self.lock:
+            if (
+                self.published is not None
+                and now - self.published < settings.METRICS_PUBLISH_INTERVAL
+            ):
+                return
+            self.published = now
+        publish_metrics(get_process_name(), label="process")
+
+
+publish_process_metrics = ThrottledPublisher()
+
+
+def get_published_metrics(label):
+    """Returns the last metrics each live publisher of `label` published,
+    by name."""
+    publishers = cache.get(PUBLISHERS_KEYS[label], set())
+    snapshots = cache.get_many([get_published_key(label, name) for name in publishers])
+    metrics = {
+        name: snapshots[get_published_key(label, name)]
+        for name in sorted(publishers)
+        if get_published_key(label, name) in snapshots
+    }
+    if len(metrics) < len(publishers):
+        cache.set(PUBLISHERS_KEYS[label], set(metrics), timeout=None)
+    return metrics
+
+
+def expose():
+    """Returns the metrics of every web process, told apart by a `process`
+    label, and of every Celery worker, told apart by a `worker` label, in
+    the Prometheus text format.
+
+    The answering process publishes its own metrics first, so they are
+    current. Database connection metrics are this process's only.
+    """
+    process = get_process_name()
+    publish_metrics(process, label="process")
+    published = {label: get_published_metrics(label) for label in ["process", "worker"]}
+    lines = []
+    for family in REGISTRY:
+        samples = []
+        for label, snapshots in published.items():
+            for name, snapshot in snapshots.items():
+                samples += [
+                    ({**dict(zip(family.labels, values)), label: name}, value)
+                    for values, value in sorted(snapshot.get(family.name, {}).items())
+                ]
+        lines += family.expose(samples)
+    lines += connection_stats.expose({"process": process})
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,78 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from config.metrics import (RequestTimings, current_timings,
+                            install_query_timer, publish_process_metrics,
+                            record_request)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """Times every request, its SQL queries and the rendering of its body.
+
+    The timings go into the per-view histograms of `config.metrics`, which
+    the process shares through the cache every METRICS_PUBLISH_INTERVAL
+    seconds, and into a Server-Timing header. Requests slower than
+    SLOW_REQUEST_THRESHOLD milliseconds are logged with their breakdown.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened later get the timer on creation.
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.process_timings(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.process_timings(request, response, timings)
+
+    def process_timings(self, request, response, timings):
+        total = timings.total
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        record_request((view, request.method), timings, total)
+        publish_process_metrics()
+
+        response.headers["Server-Timing"] = (
+            f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries", '
+            f"serialize;dur={timings.serialize * 1000:.1f}, "
+            f"total;dur={total * 1000:.1f}"
+        )
+        if total * 1000 > settings.SLOW_REQUEST_THRESHOLD:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, "
+                "%.0f ms serializing",
+                request.method,
+                request.get_full_path(),
+                view,
+                total * 1000,
+                timings.queries,
+                timings.db * 1000,
+                timings.serialize * 1000,
+            )
+        return response
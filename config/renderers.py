@@ -0,0 +1,19 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from config.metrics import current_timings
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer adding the time it takes to the serialization timing of
+    the current request."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        timings = current_timings.get()
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            if timings is not None:
+                timings.serialize += time.perf_counter() - started
@@ -0,0 +1,43 @@
+from rest_framework.permissions import SAFE_METHODS
+
+
+def get_requested_fields(request, field_names):
+    """Returns the names out of `field_names` a read request asks for with
+    `?fields=a,b` and `?exclude=c`, in their original order.
+
+    Unknown names are ignored; write requests always get every field.
+    """
+    field_names = list(field_names)
+    if request is None or request.method not in SAFE_METHODS:
+        return field_names
+    fields = request.query_params.get("fields")
+    if fields:
+        wanted = set(fields.split(","))
+        field_names = [name for name in field_names if name in wanted]
+    exclude = request.query_params.get("exclude")
+    if exclude:
+        unwanted = set(exclude.split(","))
+        field_names = [name for name in field_names if name not in unwanted]
+    return field_names
+
+
+def defer_unrequested(queryset, request, field_names, required=("id",)):
+    """Loads only the model fields behind the requested `field_names`, plus
+    the `required` ones the view itself relies on."""
+    requested = get_requested_fields(request, field_names)
+    if requested == list(field_names):
+        return queryset
+    concrete = {field.name for field in queryset.model._meta.concrete_fields}
+    return queryset.only(*required, *(name for name in requested if name in concrete))
+
+
+class SparseFieldsMixin:
+    """Serializer mixin dropping the fields a read request did not ask for
+    with `?fields=` or `?exclude=`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = set(get_requested_fields(self.context.get("request"), self.fields))
+        for name in list(self.fields):
+            if name not in requested:
+                self.fields.pop(name)
@@ -46,11 +46,13 @@ INSTALLED_APPS = [
     "corsheaders",
     "drf_spectacular",
     "django_celery_beat",
+    "django_filters",
     "users",
     "habits",
 ]
 
 MIDDLEWARE = [
+    "config.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -61,6 +63,18 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
 ]
 
+# Requests slower than this many milliseconds are logged with the time
+# spent on SQL and serialization
+SLOW_REQUEST_THRESHOLD = int(os.getenv("SLOW_REQUEST_THRESHOLD") or 500)
+# Bearer token Prometheus scrapes /metrics/ with; unset, /metrics/ is closed
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Celery workers share their metrics through the cache after every task,
+# web processes at most every METRICS_PUBLISH_INTERVAL seconds after a
+# request; a process silent for WORKER_METRICS_TTL seconds drops out of
+# /metrics/
+WORKER_METRICS_TTL = int(os.getenv("WORKER_METRICS_TTL") or 300)
+METRICS_PUBLISH_INTERVAL = int(os.getenv("METRICS_PUBLISH_INTERVAL") or 15)
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -86,12 +100,18 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        # PostgreSQL, recording connection metrics
+        "ENGINE": "config.db",
         "NAME": os.getenv("POSTGRES_DB"),
         "USER": os.getenv("POSTGRES_USER"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        # Seconds a connection is kept open for reuse by later requests and
+        # Celery tasks (0 closes it after each); a kept connection is pinged
+        # before its first use by a request or task and reopened if dead.
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE") or 60),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -141,19 +161,24 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("users.authentication.CachedJWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "config.renderers.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=20),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
+# Seconds an authenticated user is served from the cache instead of the
+# database; saving or deleting the user drops it right away
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL") or 60)
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "SPA_health_tracker",
@@ -164,8 +189,60 @@ SPECTACULAR_SETTINGS = {
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Shared between web and Celery processes when CACHE_URL points at Redis
+if os.getenv("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("CACHE_URL"),
+        }
+    }
+SHARED_CACHE = bool(os.getenv("CACHE_URL"))
+# ETags and the public feed come from versions kept in the cache, which a
+# per-process cache cannot keep in step, so both need a shared one
+CONDITIONAL_GET = SHARED_CACHE
+# Seconds those versions are kept; an expired one restarts at the current
+# time, which only costs clients a full response
+VERSION_TIMEOUT = int(os.getenv("VERSION_TIMEOUT") or 86400)
+
 TELEGRAM_URL = os.getenv("TELEGRAM_URL")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+# Connections kept alive to the Bot API, also the number of concurrent sends
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE") or 32)
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT") or 10)
+# Bot API limits: messages per second overall and to a single chat. The
+# global limit is enforced per worker process, so split it between them.
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE") or 30)
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE") or 1)
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES") or 3)
+# Failed batches in a row that pause dispatch, and for how many seconds
+TELEGRAM_CIRCUIT_THRESHOLD = int(os.getenv("TELEGRAM_CIRCUIT_THRESHOLD") or 5)
+TELEGRAM_CIRCUIT_RESET_TIMEOUT = int(os.getenv("TELEGRAM_CIRCUIT_RESET_TIMEOUT") or 60)
+
+# Notification outbox: messages claimed per batch, how long a claim is held
+# before another dispatcher may take it over, and the retry policy
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE") or 100)
+NOTIFICATION_LEASE = int(os.getenv("NOTIFICATION_LEASE") or 300)
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS") or 5)
+NOTIFICATION_RETRY_DELAY = int(os.getenv("NOTIFICATION_RETRY_DELAY") or 30)
+NOTIFICATION_MAX_RETRY_DELAY = int(os.getenv("NOTIFICATION_MAX_RETRY_DELAY") or 3600)
+
+# Seconds the serialized public habits are cached for all users, and how
+# long other requests wait for the one rebuilding them after a change
+PUBLIC_FEED_TIMEOUT = int(os.getenv("PUBLIC_FEED_TIMEOUT") or 3600)
+PUBLIC_FEED_LOCK_TIMEOUT = int(os.getenv("PUBLIC_FEED_LOCK_TIMEOUT") or 5)
+# Public habits, lowest ids first, kept in that cache; pages reaching past
+# them are queried instead
+PUBLIC_FEED_SIZE = int(os.getenv("PUBLIC_FEED_SIZE") or 500)
+
+# Habit completions are buffered in this Redis database and written in
+# batches of COMPLETION_BATCH_SIZE at least every COMPLETION_FLUSH_INTERVAL
+# seconds, up to COMPLETION_FLUSH_BATCHES batches per flush task. Without
+# it every completion is written as it arrives.
+COMPLETION_BUFFER_URL = os.getenv("COMPLETION_BUFFER_URL")
+COMPLETION_BATCH_SIZE = int(os.getenv("COMPLETION_BATCH_SIZE") or 1000)
+COMPLETION_FLUSH_INTERVAL = int(os.getenv("COMPLETION_FLUSH_INTERVAL") or 5)
+COMPLETION_FLUSH_BATCHES = int(os.getenv("COMPLETION_FLUSH_BATCHES") or 10)
 
 # Celery Configuration Options
 CELERY_TIMEZONE = TIME_ZONE
@@ -177,9 +254,29 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
 
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
+# Habits handled by one worker task when a minute's reminders are fanned out
+REMINDER_SHARD_SIZE = int(os.getenv("REMINDER_SHARD_SIZE") or 500)
+# Reminder runs are scheduled for the next habit due; the beat schedule only
+# backs them up every REMINDER_INTERVAL minutes. Reminders later than
+# REMINDER_MAX_CATCHUP minutes are skipped instead of sent.
+REMINDER_INTERVAL = int(os.getenv("REMINDER_INTERVAL") or 15)
+REMINDER_MAX_CATCHUP = int(os.getenv("REMINDER_MAX_CATCHUP") or 60)
+
 CELERY_BEAT_SCHEDULE = {
     "send_reminders": {
         "task": "habits.tasks.send_reminders",  # Task path
-        "schedule": timedelta(minutes=1),  # Schedule for task execution
+        "schedule": timedelta(minutes=REMINDER_INTERVAL),  # Schedule for task execution
+    },
+    "dispatch_notifications": {
+        "task": "habits.tasks.dispatch_notifications",
+        "schedule": timedelta(minutes=1),
+    },
+    "refresh_utc_offsets": {
+        "task": "habits.tasks.refresh_utc_offsets",
+        "schedule": timedelta(minutes=5),
+    },
+    "flush_completions": {
+        "task": "habits.tasks.flush_completions",
+        "schedule": timedelta(seconds=COMPLETION_FLUSH_INTERVAL),
     },
 }
@@ -20,10 +20,14 @@ from django.urls import include, path
 from drf_spectacular.views import (SpectacularAPIView, SpectacularRedocView,
                                    SpectacularSwaggerView)
 
+from config.views import DatabaseMetricsAPIView, MetricsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("users/", include("users.urls", namespace="users")),
     path("habits/", include("habits.urls", namespace="habits")),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("metrics/db/", DatabaseMetricsAPIView.as_view(), name="db-metrics"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     # Optional UI:
     path(
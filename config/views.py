@@ -0,0 +1,107 @@
+import os
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views import View
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework.generics import GenericAPIView
+from rest_framework.mixins import ListModelMixin
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.metrics import connection_stats, expose, get_server_connections
+
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines using the async ORM.
+
+    Under ASGI a request waiting on the database or on a slow client holds
+    no worker thread. DRF's authentication, permission and throttle checks
+    are synchronous, so they run through `sync_to_async`.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncGenericAPIView(AsyncAPIView, GenericAPIView):
+    pass
+
+
+class AsyncListAPIView(ListModelMixin, AsyncGenericAPIView):
+    """Subclasses override `list` with a coroutine; the mixin marks the view
+    as a list for the schema."""
+
+    async def get(self, request, *args, **kwargs):
+        return await self.list(request, *args, **kwargs)
+
+
+class AsyncRetrieveAPIView(AsyncGenericAPIView):
+    async def get(self, request, *args, **kwargs):
+        return await self.retrieve(request, *args, **kwargs)
+
+
+@extend_schema(
+    tags=["Metrics"],
+    summary="Database connection metrics",
+    responses=OpenApiTypes.OBJECT,
+)
+class DatabaseMetricsAPIView(APIView):
+    """Reports the database connections of the answering process and, on
+    PostgreSQL, those of all processes against max_connections."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(
+            {
+                "pid": os.getpid(),
+                "process": connection_stats.snapshot(),
+                "server": get_server_connections(),
+            }
+        )
+
+
+class MetricsView(View):
+    """Serves the metrics every web process and Celery worker shared through
+    the cache, labelled by `process` and `worker`, in the Prometheus text
+    format to scrapers presenting METRICS_TOKEN as a bearer token."""
+
+    def get(self, request, *args, **kwargs):
+        token = settings.METRICS_TOKEN
+        if not token or not constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            return HttpResponseForbidden()
+        return HttpResponse(
+            expose(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from habits.models import Habit
+from habits.models import Habit, Notification
 
 
 @admin.register(Habit)
@@ -18,3 +18,17 @@ class HabitAdmin(admin.ModelAdmin):
         "duration",
         "is_public",
     )
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "user",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+        "sent_at",
+    )
+    list_filter = ("status",)
@@ -0,0 +1,137 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+
+PUBLIC_HABITS_KEY = "habits:version:public"
+PUBLIC_FEED_LOCK_KEY = "habits:public-feed:lock"
+
+
+def get_user_habits_key(user_id):
+    return f"habits:version:user:{user_id}"
+
+
+def get_habit_key(habit_id):
+    return f"habits:version:habit:{habit_id}"
+
+
+def get_habit_version_keys(habit, was_public=False):
+    """Returns the keys of the versions a change to `habit` invalidates."""
+    keys = [get_habit_key(habit.pk), get_user_habits_key(habit.user_id)]
+    if habit.is_public or was_public:
+        keys.append(PUBLIC_HABITS_KEY)
+    return keys
+
+
+def get_versions(keys):
+    """Returns the version of every key in one cache lookup.
+
+    A version is the time of the last change. Keys missing from the cache
+    start at the current time, which invalidates whatever clients hold, so
+    versions may expire after VERSION_TIMEOUT seconds rather than pile up
+    for every habit ever read or deleted.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=settings.VERSION_TIMEOUT)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    now = time.time()
+    cache.set_many({key: now for key in keys}, timeout=settings.VERSION_TIMEOUT)
+
+
+def get_public_feed(build):
+    """Returns the public habits as built by `build`, shared by all users
+    through the cache until a public habit changes.
+
+    On a miss only one caller rebuilds the feed; the others wait up to
+    PUBLIC_FEED_LOCK_TIMEOUT seconds for it and build it themselves only if
+    it does not show up.
+    """
+    (version,) = get_versions([PUBLIC_HABITS_KEY])
+    key = f"habits:public-feed:{version}"
+    feed = cache.get(key)
+    if feed is not None:
+        return feed
+
+    if cache.add(PUBLIC_FEED_LOCK_KEY, True, timeout=settings.PUBLIC_FEED_LOCK_TIMEOUT):
+        try:
+            feed = build()
+            cache.set(key, feed, timeout=settings.PUBLIC_FEED_TIMEOUT)
+        finally:
+            cache.delete(PUBLIC_FEED_LOCK_KEY)
+        return feed
+
+    deadline = time.monotonic() + settings.PUBLIC_FEED_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        feed = cache.get(key)
+        if feed is not None:
+            return feed
+    return build()
+
+
+def get_etag(request, keys):
+    """Returns the ETag of a response to `request` that depends on the
+    versions of `keys`.
+
+    There is no Last-Modified: rounded to the second it would let a change
+    made in the same second as the client's copy go unnoticed.
+    """
+    versions = get_versions(keys)
+    digest = hashlib.md5(
+        f"{request.user.pk}:{request.get_full_path()}:{versions}".encode()
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def set_etag(response, etag):
+    if response.status_code in (200, 304):
+        response.headers["ETag"] = etag
+    return response
+
+
+class ConditionalGetMixin:
+    """Answers GET requests with an ETag derived from cached versions, and
+    with a 304 when the client's copy is current, before any database query
+    or serialization.
+
+    Views list the cache keys their response depends on in
+    `get_version_keys`. The versions only hold across processes in a shared
+    cache, so without one (CONDITIONAL_GET off) requests are answered in
+    full.
+    """
+
+    def get_version_keys(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        if not settings.CONDITIONAL_GET:
+            return super().get(request, *args, **kwargs)
+        etag = get_etag(request, self.get_version_keys())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_etag(response, etag)
+
+
+class AsyncConditionalGetMixin(ConditionalGetMixin):
+    """ConditionalGetMixin for views with an async `get`."""
+
+    async def get(self, request, *args, **kwargs):
+        if not settings.CONDITIONAL_GET:
+            return await super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+        etag = await sync_to_async(get_etag)(request, self.get_version_keys())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await super(ConditionalGetMixin, self).get(
+                request, *args, **kwargs
+            )
+        return set_etag(response, etag)
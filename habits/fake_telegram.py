@@ -0,0 +1,82 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTelegramServer:
+    """Local stand-in for the Bot API `sendMessage` method.
+
+    Answers every request after `latency` seconds and rejects a
+    `throttle_ratio` share of them with a 429 asking to retry after
+    `retry_after` seconds, the way the Bot API does under flood control.
+    """
+
+    def __init__(self, latency=0.0, throttle_ratio=0.0, retry_after=1):
+        self.latency = latency
+        self.throttle_ratio = throttle_ratio
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        # `time.perf_counter()` of every accepted message
+        self.delivered_at = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/bot"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self):
+        """Returns the status code and body of the next response."""
+        time.sleep(self.latency)
+        throttle = random.random() < self.throttle_ratio
+        with self.lock:
+            self.requests += 1
+            if throttle:
+                self.throttled += 1
+            else:
+                self.delivered_at.append(time.perf_counter())
+        if throttle:
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        return 200, {"ok": True, "result": {}}
+
+    def get_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, payload = fake.respond()
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.do_GET()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,27 @@
+from django_filters import rest_framework as filters
+
+from habits.models import Habit
+
+
+class HabitFilter(filters.FilterSet):
+    """Filters of the habit list, each served by an index on Habit."""
+
+    time_after = filters.TimeFilter(field_name="time", lookup_expr="gte")
+    time_before = filters.TimeFilter(field_name="time", lookup_expr="lte")
+    mine = filters.BooleanFilter(
+        method="filter_mine",
+        label="Only the user's own habits, or only other users' public ones",
+    )
+
+    class Meta:
+        model = Habit
+        fields = ["is_pleasant", "is_public", "location", "periodicity"]
+
+    def filter_mine(self, queryset, name, value):
+        if value:
+            return queryset.filter(user=self.request.user)
+        return queryset.exclude(user=self.request.user)
+
+    @classmethod
+    def is_filtering(cls, request):
+        return any(name in request.query_params for name in cls.base_filters)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from habits.management.commands.bench_reminders import percentile
+from users.models import User
+
+
+async def fetch(url, token):
+    """GETs `url` over a fresh connection and returns the status code and
+    the seconds until the whole response was read."""
+    parts = urlsplit(url)
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        writer.write(
+            (
+                f"GET {parts.path or '/'}{'?' + parts.query if parts.query else ''} "
+                f"HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                f"Authorization: Bearer {token}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+    return int(status_line.split()[1]), time.perf_counter() - started
+
+
+async def load(url, token, concurrency, requests):
+    """Sends `requests` GETs to `url` from `concurrency` clients at once."""
+    remaining = iter(range(requests))
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        for _ in remaining:
+            try:
+                status, latency = await fetch(url, token)
+            except OSError:
+                errors += 1
+                continue
+            if status == 200:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the sync views served by a WSGI server with the async views "
+        "served by an ASGI server at rising numbers of concurrent clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wsgi-url",
+            default="http://127.0.0.1:8000/habits/habits/",
+            help="Endpoint of the WSGI server.",
+        )
+        parser.add_argument(
+            "--asgi-url",
+            default="http://127.0.0.1:8001/habits/habits/async/",
+            help="Endpoint of the ASGI server.",
+        )
+        parser.add_argument(
+            "--email", help="User to authenticate as; defaults to the first user."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[1, 10, 100, 500]
+        )
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="Requests per level."
+        )
+        parser.add_argument("--output", help="Writes the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["email"]:
+            users = users.filter(email=options["email"])
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as.")
+        token = str(AccessToken.for_user(user))
+
+        results = {}
+        for name in ["wsgi", "asgi"]:
+            url = options[f"{name}_url"]
+            results[name] = [
+                asyncio.run(load(url, token, concurrency, options["requests"]))
+                for concurrency in options["concurrency"]
+            ]
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,200 @@
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from config.celery import app as celery_app
+from habits import services
+from habits.fake_telegram import FakeTelegramServer
+from habits.models import Habit, Notification
+from habits.tasks import (dispatch_notifications, get_due_habits,
+                          queue_reminder_shard, split_into_shards)
+from users.models import User
+
+EMAIL_DOMAIN = "bench.invalid"
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the reminder pipeline end to end against a local fake "
+        "Telegram Bot API and reports throughput, latency, queries and memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--habits",
+            type=int,
+            default=300,
+            help="Habits spread over the users, all due in the same minute.",
+        )
+        parser.add_argument(
+            "--latency", type=float, default=50, help="Bot API latency in ms."
+        )
+        parser.add_argument(
+            "--throttle-ratio",
+            type=float,
+            default=0.0,
+            help="Share of Bot API requests answered with a 429.",
+        )
+        parser.add_argument("--retry-after", type=int, default=1)
+        parser.add_argument(
+            "--global-rate",
+            type=float,
+            help="Overrides TELEGRAM_GLOBAL_RATE for the run.",
+        )
+        parser.add_argument(
+            "--shard-size", type=int, help="Overrides REMINDER_SHARD_SIZE."
+        )
+        parser.add_argument("--output", help="Writes the results as JSON to this file.")
+        parser.add_argument(
+            "--keep", action="store_true", help="Keeps the seeded users and habits."
+        )
+
+    def handle(self, *args, **options):
+        due_at = timezone.now().replace(second=0, microsecond=0)
+        self.cleanup()
+        self.check_idle()
+        self.seed(options["users"], options["habits"], due_at)
+
+        overrides = {"TELEGRAM_TOKEN": "bench"}
+        if options["global_rate"]:
+            overrides["TELEGRAM_GLOBAL_RATE"] = options["global_rate"]
+        if options["shard_size"]:
+            overrides["REMINDER_SHARD_SIZE"] = options["shard_size"]
+
+        fake = FakeTelegramServer(
+            latency=options["latency"] / 1000,
+            throttle_ratio=options["throttle_ratio"],
+            retry_after=options["retry_after"],
+        )
+        try:
+            with fake, override_settings(TELEGRAM_URL=fake.url, **overrides):
+                results = self.run_pipeline(fake)
+        finally:
+            if not options["keep"]:
+                self.cleanup()
+
+        results.update(
+            {
+                "users": options["users"],
+                "habits": options["habits"],
+                "bot_api": {
+                    "latency_ms": options["latency"],
+                    "throttle_ratio": options["throttle_ratio"],
+                    "requests": fake.requests,
+                    "throttled": fake.throttled,
+                },
+            }
+        )
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def seed(self, users, habits, due_at):
+        User.objects.bulk_create(
+            User(email=f"{index}@{EMAIL_DOMAIN}", tg_chat_id=f"bench-{index}")
+            for index in range(users)
+        )
+        user_ids = list(
+            User.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").values_list(
+                "id", flat=True
+            )
+        )
+        Habit.objects.bulk_create(
+            Habit(
+                user_id=user_ids[index % users],
+                location="bench",
+                time=due_at.time(),
+                next_fire_at=due_at,
+                action=f"habit {index}",
+                is_pleasant=True,
+                duration=60,
+            )
+            for index in range(habits)
+        )
+
+    def check_idle(self):
+        """Refuses to run next to real reminders: planning works on user id
+        ranges and dispatch drains the whole outbox, so they would be sent
+        to the fake Bot API and lost."""
+        if get_due_habits(timezone.now()).exists():
+            raise CommandError(
+                "Habits of other users are due; run the benchmark on an "
+                "idle database."
+            )
+        if Notification.objects.filter(
+            status__in=[Notification.PENDING, Notification.SENDING]
+        ).exists():
+            raise CommandError(
+                "The outbox holds undelivered notifications; run the benchmark "
+                "on an idle database."
+            )
+
+    def cleanup(self):
+        User.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").delete()
+
+    def run_pipeline(self, fake):
+        """Runs planning, outbox writes and dispatch inline in this process,
+        the way the workers would run them."""
+        services._client = None
+        queries = []
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(
+                lambda execute, *args: queries.append(1) or execute(*args)
+            ):
+                user_ids = (
+                    get_due_habits(timezone.now())
+                    .filter(user__email__endswith=f"@{EMAIL_DOMAIN}")
+                    .order_by("user_id")
+                    .values_list("user_id", flat=True)
+                )
+                for first, last in split_into_shards(
+                    user_ids.iterator(), settings.REMINDER_SHARD_SIZE
+                ):
+                    queue_reminder_shard(first, last)
+                dispatch_notifications()
+            duration = time.perf_counter() - start
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            celery_app.conf.task_always_eager = eager
+            services._client = None
+
+        notifications = Notification.objects.filter(
+            user__email__endswith=f"@{EMAIL_DOMAIN}"
+        )
+        sent = notifications.filter(status=Notification.SENT).count()
+        # Time from the start of the run until the Bot API accepted a message
+        latencies = [(at - start) * 1000 for at in fake.delivered_at]
+        return {
+            "messages": notifications.count(),
+            "sent": sent,
+            "failed": notifications.exclude(status=Notification.SENT).count(),
+            "duration_s": round(duration, 3),
+            "throughput_per_s": round(sent / duration, 1),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.5) or 0, 1),
+                "p99": round(percentile(latencies, 0.99) or 0, 1),
+            },
+            "db_queries": len(queries),
+            "peak_memory_kb": peak_memory // 1024,
+        }
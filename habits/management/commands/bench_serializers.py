@@ -0,0 +1,78 @@
+import datetime
+import json
+import timeit
+
+from django.core.management import BaseCommand
+
+from habits.models import Habit
+from habits.serializers import HABIT_COLUMNS, HabitSerializer, serialize_habit
+
+
+def make_habits(count):
+    return [
+        Habit(
+            id=index + 1,
+            user_id=index % 50 + 1,
+            location="Kitchen",
+            time=datetime.time(hour=index % 24, minute=index % 60),
+            action=f"habit {index}",
+            is_pleasant=False,
+            related_habit_id=index or None,
+            periodicity=1,
+            reward="",
+            duration=60,
+            is_public=True,
+        )
+        for index in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-row cost of rendering habits with HabitSerializer "
+        "and with the read-only .values() path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Page sizes."
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Best of this many runs is taken."
+        )
+        parser.add_argument("--output", help="Writes the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options["sizes"]:
+            habits = make_habits(size)
+            rows = [
+                {column: getattr(habit, column) for column in HABIT_COLUMNS}
+                for habit in habits
+            ]
+            model_serializer = self.measure(
+                lambda: HabitSerializer(habits, many=True).data, options["repeat"]
+            )
+            values = self.measure(
+                lambda: [serialize_habit(row) for row in rows], options["repeat"]
+            )
+            results.append(
+                {
+                    "page_size": size,
+                    "model_serializer_us_per_row": round(
+                        model_serializer / size * 1e6, 2
+                    ),
+                    "values_us_per_row": round(values / size * 1e6, 2),
+                    "speedup": round(model_serializer / values, 1),
+                }
+            )
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def measure(self, render, repeat):
+        number = max(1, 1000 // len(render()))
+        return min(timeit.repeat(render, number=number, repeat=repeat)) / number
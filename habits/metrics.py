@@ -0,0 +1,33 @@
+from config.metrics import CounterVec, HistogramVec
+
+# Upper bounds in seconds of the reminder lag histogram buckets
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+habits_scanned = CounterVec(
+    "reminder_habits_scanned_total", "Due habits found by reminder runs."
+)
+habits_skipped = CounterVec(
+    "reminder_habits_skipped_total",
+    "Due habits whose reminder was dropped as more than REMINDER_MAX_CATCHUP "
+    "minutes late.",
+)
+queue_lag_seconds = HistogramVec(
+    "reminder_queue_lag_seconds",
+    "Time from the minute a habit was due to its reminder being queued.",
+    buckets=LAG_BUCKETS,
+)
+notifications_handled = CounterVec(
+    "notifications_total",
+    "Telegram messages attempted, by outcome: sent, retried or failed.",
+    ("outcome",),
+)
+send_lag_seconds = HistogramVec(
+    "reminder_send_lag_seconds",
+    "Time from the minute a reminder was due to its delivery to Telegram.",
+    buckets=LAG_BUCKETS,
+)
+telegram_request_seconds = HistogramVec(
+    "telegram_request_duration_seconds",
+    "Latency of Telegram Bot API requests, by status code or `error`.",
+    ("status",),
+)
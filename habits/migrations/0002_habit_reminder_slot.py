@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 11:51
+
+from django.db import migrations, models
+from django.db.models.functions import ExtractHour, ExtractMinute
+
+
+def fill_reminder_slot(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    Habit.objects.update(reminder_slot=ExtractHour("time") * 60 + ExtractMinute("time"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="habit",
+            name="reminder_slot",
+            field=models.PositiveSmallIntegerField(
+                db_index=True, default=0, editable=False, verbose_name="reminder slot"
+            ),
+        ),
+        migrations.RunPython(fill_reminder_slot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 11:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0002_habit_reminder_slot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="habit",
+            name="reminder_slot",
+            field=models.PositiveSmallIntegerField(
+                default=0, editable=False, verbose_name="reminder slot"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(
+                fields=["reminder_slot", "user"], name="habit_reminder_slot_user"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0003_habit_reminder_slot_user_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReminderWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "processed_until",
+                    models.DateTimeField(verbose_name="processed until"),
+                ),
+            ],
+            options={
+                "verbose_name": "reminder watermark",
+                "verbose_name_plural": "reminder watermarks",
+            },
+        ),
+    ]
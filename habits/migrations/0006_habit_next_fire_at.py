@@ -0,0 +1,64 @@
+# Generated by Django 5.1 on 2026-10-18 12:20
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_next_fire_at(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    now = timezone.now()
+    habits = list(Habit.objects.select_related("user"))
+    for habit in habits:
+        tz = habit.user.timezone
+        day = now.astimezone(tz).date()
+        habit.next_fire_at = datetime.combine(day, habit.time, tzinfo=tz)
+        if habit.next_fire_at <= now:
+            habit.next_fire_at = datetime.combine(
+                day + timedelta(days=1), habit.time, tzinfo=tz
+            )
+    Habit.objects.bulk_update(habits, ["next_fire_at"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0005_notification"),
+        ("users", "0004_user_timezone"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="habit",
+            name="habit_reminder_slot_user",
+        ),
+        migrations.RemoveField(
+            model_name="habit",
+            name="reminder_slot",
+        ),
+        migrations.DeleteModel(
+            name="ReminderWatermark",
+        ),
+        migrations.AddField(
+            model_name="habit",
+            name="next_fire_at",
+            field=models.DateTimeField(
+                editable=False, null=True, verbose_name="next reminder at"
+            ),
+        ),
+        migrations.RunPython(fill_next_fire_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="habit",
+            name="next_fire_at",
+            field=models.DateTimeField(editable=False, verbose_name="next reminder at"),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(
+                fields=["next_fire_at", "user"], name="habit_next_fire_at_user"
+            ),
+        ),
+    ]
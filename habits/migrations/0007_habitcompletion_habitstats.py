@@ -0,0 +1,83 @@
+# Generated by Django 5.1 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0006_habit_next_fire_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HabitStats",
+            fields=[
+                (
+                    "habit",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="habits.habit",
+                        verbose_name="habit",
+                    ),
+                ),
+                (
+                    "current_streak",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="current streak"
+                    ),
+                ),
+                (
+                    "best_streak",
+                    models.PositiveIntegerField(default=0, verbose_name="best streak"),
+                ),
+                (
+                    "last_done",
+                    models.DateField(blank=True, null=True, verbose_name="last done"),
+                ),
+            ],
+            options={
+                "verbose_name": "habit stats",
+                "verbose_name_plural": "habit stats",
+            },
+        ),
+        migrations.CreateModel(
+            name="HabitCompletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("completed_at", models.DateTimeField(verbose_name="completed at")),
+                ("completed_on", models.DateField(verbose_name="completed on")),
+                (
+                    "habit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="completions",
+                        to="habits.habit",
+                        verbose_name="habit",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "habit completion",
+                "verbose_name_plural": "habit completions",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("habit", "completed_on"),
+                        name="habit_completion_once_a_day",
+                    )
+                ],
+            },
+        ),
+    ]
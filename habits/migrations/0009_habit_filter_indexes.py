@@ -0,0 +1,39 @@
+# Generated by Django 5.1 on 2026-10-18 12:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0008_habit_list_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(fields=["user", "time"], name="habit_user_time"),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["time"],
+                name="habit_public_time",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(fields=["user", "location"], name="habit_user_location"),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["location"],
+                name="habit_public_location",
+            ),
+        ),
+    ]
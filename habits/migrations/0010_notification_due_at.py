@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0009_habit_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="due_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the earliest reminder in the message was due.",
+                null=True,
+                verbose_name="due at",
+            ),
+        ),
+    ]
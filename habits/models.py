@@ -1,10 +1,49 @@
+from datetime import date, datetime, timedelta
+
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
 
+def get_next_fire_at(time, tz, after, periodicity=1, last_fired_at=None):
+    """Returns the first moment after `after` a habit performed at the local
+    `time` in `tz` is due.
+
+    Without `last_fired_at` that is the next occurrence of `time`; otherwise
+    the habit is due every `periodicity` days counted from the local date it
+    last fired. Each date is converted on its own, so DST is followed.
+    """
+    if last_fired_at is None:
+        day, step = after.astimezone(tz).date(), 1
+    else:
+        day = last_fired_at.astimezone(tz).date() + timedelta(days=periodicity)
+        step = periodicity
+    while True:
+        fire_at = datetime.combine(day, time, tzinfo=tz)
+        if fire_at > after:
+            return fire_at
+        day += timedelta(days=step)
+
+
+class HabitQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Habits of `user` and everybody's public habits, in a stable order.
+
+        One query with an OR of two conditions, each served by its own index,
+        rather than a union of two querysets.
+        """
+        visible = models.Q(is_public=True)
+        if user.is_authenticated:
+            visible |= models.Q(user=user)
+        return self.filter(visible).order_by("id")
+
+
 class Habit(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="user")
+    # Indexed together with the id in Meta.indexes
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, db_index=False, verbose_name="user"
+    )
     location = models.CharField(max_length=100, verbose_name="location")
     time = models.TimeField(verbose_name="time")
     action = models.CharField(max_length=100, verbose_name="action")
@@ -19,7 +58,239 @@ class Habit(models.Model):
     reward = models.CharField(max_length=100, blank=True, verbose_name="reward")
     duration = models.PositiveIntegerField(verbose_name="duration")
     is_public = models.BooleanField(default=False, verbose_name="public")
+    next_fire_at = models.DateTimeField(editable=False, verbose_name="next reminder at")
+
+    objects = HabitQuerySet.as_manager()
 
     class Meta:
         verbose_name = "habit"
         verbose_name_plural = "habits"
+        indexes = [
+            # Serves finding the due habits, splitting them into user-id
+            # ranges and looking up the earliest upcoming reminder.
+            models.Index(
+                fields=["next_fire_at", "user"], name="habit_next_fire_at_user"
+            ),
+            # Serve the habit list, which pages through a user's habits and
+            # the public ones by id.
+            models.Index(fields=["user", "id"], name="habit_user_id"),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_public=True),
+                name="habit_public_id",
+            ),
+            # Serve the list filters on time of day and location, both for
+            # the user's own habits and the public ones. The boolean and
+            # periodicity filters narrow the rows these leave too little to
+            # be worth an index of their own.
+            models.Index(fields=["user", "time"], name="habit_user_time"),
+            models.Index(
+                fields=["time"],
+                condition=models.Q(is_public=True),
+                name="habit_public_time",
+            ),
+            models.Index(fields=["user", "location"], name="habit_user_location"),
+            models.Index(
+                fields=["location"],
+                condition=models.Q(is_public=True),
+                name="habit_public_location",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_schedule = instance.get_schedule()
+        instance._loaded_is_public = instance.__dict__.get("is_public")
+        return instance
+
+    def get_schedule(self):
+        return self.__dict__.get("time"), self.__dict__.get("periodicity")
+
+    def save(self, *args, **kwargs):
+        if self.update_schedule():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "next_fire_at"}
+        super().save(*args, **kwargs)
+
+    def update_schedule(self):
+        """Works out when to remind next if the schedule changed since the
+        habit was loaded, so the reminder task can look due habits up by
+        index. Returns whether `next_fire_at` was recomputed."""
+        self.time = self._meta.get_field("time").to_python(self.time)
+        if self.get_schedule() == getattr(self, "_loaded_schedule", None):
+            return False
+        self.next_fire_at = get_next_fire_at(
+            self.time, self.user.timezone, timezone.now()
+        )
+        self._loaded_schedule = self.get_schedule()
+        return True
+
+    def advance(self, now):
+        """Moves `next_fire_at` past `now` once the reminder has been sent."""
+        self.next_fire_at = get_next_fire_at(
+            self.time,
+            self.user.timezone,
+            now,
+            periodicity=self.periodicity,
+            last_fired_at=self.next_fire_at,
+        )
+
+    def reschedule(self, previous_tz=None):
+        """Moves `next_fire_at` to `time` in the user's timezone on the same
+        local date, in `previous_tz` if given, after the timezone or its
+        rules changed. Returns whether it moved.
+
+        A reminder already due stays due; one still ahead that would land in
+        the past is moved on by the habit's periodicity.
+        """
+        tz = self.user.timezone
+        day = self.next_fire_at.astimezone(previous_tz or tz).date()
+        next_fire_at = datetime.combine(day, self.time, tzinfo=tz)
+        now = timezone.now()
+        if self.next_fire_at > now:
+            while next_fire_at <= now:
+                day += timedelta(days=self.periodicity)
+                next_fire_at = datetime.combine(day, self.time, tzinfo=tz)
+        moved = next_fire_at != self.next_fire_at
+        self.next_fire_at = next_fire_at
+        return moved
+
+
+class HabitCompletion(models.Model):
+    """An append-only record of a habit being performed.
+
+    A habit counts as done at most once per local day of its owner.
+    """
+
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="completions",
+        verbose_name="habit",
+    )
+    completed_at = models.DateTimeField(verbose_name="completed at")
+    completed_on = models.DateField(verbose_name="completed on")
+
+    class Meta:
+        verbose_name = "habit completion"
+        verbose_name_plural = "habit completions"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["habit", "completed_on"], name="habit_completion_once_a_day"
+            ),
+        ]
+
+    def to_payload(self):
+        return {
+            "habit_id": self.habit_id,
+            "completed_at": self.completed_at.isoformat(),
+            "completed_on": self.completed_on.isoformat(),
+        }
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(
+            habit_id=payload["habit_id"],
+            completed_at=datetime.fromisoformat(payload["completed_at"]),
+            completed_on=date.fromisoformat(payload["completed_on"]),
+        )
+
+
+class HabitStats(models.Model):
+    """Streak counters of a habit, kept up to date as completions come in so
+    reading them never scans the completion history."""
+
+    habit = models.OneToOneField(
+        Habit,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name="habit",
+    )
+    current_streak = models.PositiveIntegerField(
+        default=0, verbose_name="current streak"
+    )
+    best_streak = models.PositiveIntegerField(default=0, verbose_name="best streak")
+    last_done = models.DateField(null=True, blank=True, verbose_name="last done")
+
+    class Meta:
+        verbose_name = "habit stats"
+        verbose_name_plural = "habit stats"
+
+    def add(self, day):
+        """Counts a completion on the local date `day`.
+
+        Completions must be added in date order; one on or before `last_done`
+        does not change the streaks.
+        """
+        if self.last_done is not None and day <= self.last_done:
+            return
+        if (
+            self.last_done is not None
+            and (day - self.last_done).days <= self.habit.periodicity
+        ):
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.best_streak = max(self.best_streak, self.current_streak)
+        self.last_done = day
+
+    def get_current_streak(self, today):
+        """Returns the current streak, which is broken once the habit is
+        overdue on the local date `today`."""
+        if (
+            self.last_done is None
+            or (today - self.last_done).days > self.habit.periodicity
+        ):
+            return 0
+        return self.current_streak
+
+
+class Notification(models.Model):
+    """A Telegram message waiting in the outbox or already dispatched."""
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "pending"),
+        (SENDING, "sending"),
+        (SENT, "sent"),
+        (FAILED, "failed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="user")
+    chat_id = models.CharField(max_length=50, verbose_name="telegram chat-id")
+    text = models.TextField(verbose_name="text")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="status"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="attempts")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="next attempt at"
+    )
+    last_error = models.TextField(blank=True, verbose_name="last error")
+    due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="due at",
+        help_text="When the earliest reminder in the message was due.",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="created at")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="sent at")
+
+    class Meta:
+        verbose_name = "notification"
+        verbose_name_plural = "notifications"
+        indexes = [
+            # Only undelivered rows are ever claimed, so the index stays small
+            # however long the delivered history grows.
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status__in=["pending", "sending"]),
+                name="notification_due",
+            ),
+        ]
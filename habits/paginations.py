@@ -1,7 +1,54 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 10
+    ordering = "id"
 
 
 class CustomPagination(PageNumberPagination):
+    """Page-number pagination with a total count, or cursor pagination when
+    the client asks for it with `?pagination=cursor`.
+
+    Cursor pages cost the same however deep they are and skip the count
+    query; their next and previous links carry the cursor.
+    """
+
     page_size = 5
     page_size_query_param = "page_size"
     max_page_size = 10
+    mode_query_param = "pagination"
+
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or CustomCursorPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = CustomCursorPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *super().get_schema_operation_parameters(view),
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to `cursor` for cursor pagination without a count.",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            *CustomCursorPagination().get_schema_operation_parameters(view)[:1],
+        ]
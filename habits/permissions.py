@@ -9,8 +9,8 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         # so we'll always allow GET, HEAD or OPTIONS requests.
         if request.method in permissions.SAFE_METHODS:
             return (
-                obj.is_public or obj.user == request.user
+                obj.is_public or obj.user_id == request.user.pk
             )  # allow the owner to retrieve the habit
 
         # Write permissions are only allowed to the owner of the habit.
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
@@ -1,29 +1,57 @@
+from django.utils import timezone
 from rest_framework import serializers
 
-from habits.models import Habit
+from config.serializers import SparseFieldsMixin
+from habits.models import Habit, HabitCompletion, HabitStats
 
 from .validators import (validate_connected_habit_and_reward,
                          validate_connected_habit_nature,
                          validate_habit_duration, validate_habit_periodicity,
                          validate_pleasant_habit)
 
+HABIT_FIELDS = [
+    "id",
+    "user",
+    "location",
+    "time",
+    "action",
+    "is_pleasant",
+    "related_habit",
+    "periodicity",
+    "reward",
+    "duration",
+    "is_public",
+]
+# Database columns behind HABIT_FIELDS, in the same order
+HABIT_COLUMNS = [Habit._meta.get_field(field).attname for field in HABIT_FIELDS]
+HABIT_COLUMN_BY_FIELD = dict(zip(HABIT_FIELDS, HABIT_COLUMNS))
+
+
+class RelatedHabitField(serializers.PrimaryKeyRelatedField):
+    """Looks related habits up in `context["related_habits"]` when a batch
+    has loaded them all at once, instead of one query per item."""
+
+    def to_internal_value(self, data):
+        related_habits = self.context.get("related_habits")
+        if related_habits is None:
+            return super().to_internal_value(data)
+        try:
+            habit = related_habits.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if habit is None:
+            self.fail("does_not_exist", pk_value=data)
+        return habit
+
+
+class HabitSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    related_habit = RelatedHabitField(
+        queryset=Habit.objects.all(), required=False, allow_null=True
+    )
 
-class HabitSerializer(serializers.ModelSerializer):
     class Meta:
         model = Habit
-        fields = [
-            "id",
-            "user",
-            "location",
-            "time",
-            "action",
-            "is_pleasant",
-            "related_habit",
-            "periodicity",
-            "reward",
-            "duration",
-            "is_public",
-        ]
+        fields = HABIT_FIELDS
         validators = [
             validate_connected_habit_and_reward,
             validate_habit_duration,
@@ -31,3 +59,52 @@ class HabitSerializer(serializers.ModelSerializer):
             validate_pleasant_habit,
             validate_habit_periodicity,
         ]
+
+
+class HabitBatchSerializer(HabitSerializer):
+    """Validates the habits of a batch, which always belong to the current
+    user."""
+
+    class Meta(HabitSerializer.Meta):
+        read_only_fields = ["id", "user"]
+
+
+def serialize_habit(row, fields=HABIT_FIELDS):
+    """Renders `fields` of a habit the way `HabitSerializer` does, from a
+    mapping of its column values such as a `.values(*HABIT_COLUMNS)` row or
+    an instance's `__dict__`, without building a field tree for it."""
+    data = {field: row[HABIT_COLUMN_BY_FIELD[field]] for field in fields}
+    if "time" in data:
+        data["time"] = data["time"].isoformat()
+    return data
+
+
+def serialize_habits(queryset, fields=HABIT_FIELDS):
+    """Renders the habits of `queryset` for reading, straight from `.values()`."""
+    columns = [HABIT_COLUMN_BY_FIELD[field] for field in fields]
+    return [serialize_habit(row, fields) for row in queryset.values(*columns)]
+
+
+class HabitCompletionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HabitCompletion
+        fields = ["habit", "completed_at", "completed_on"]
+        read_only_fields = ["habit", "completed_on"]
+        extra_kwargs = {"completed_at": {"required": False}}
+
+    def validate_completed_at(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("A habit cannot be done in the future.")
+        return value
+
+
+class HabitStatsSerializer(serializers.ModelSerializer):
+    current_streak = serializers.SerializerMethodField()
+
+    class Meta:
+        model = HabitStats
+        fields = ["habit", "current_streak", "best_streak", "last_done"]
+
+    def get_current_streak(self, obj) -> int:
+        today = timezone.now().astimezone(obj.habit.user.timezone).date()
+        return obj.get_current_streak(today)
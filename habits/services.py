@@ -1,11 +1,309 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
 import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from habits.metrics import telegram_request_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramError(Exception):
+    """Raised when the Bot API did not accept a message."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_permanent(self):
+        """Whether sending the same message again cannot succeed, e.g. the chat
+        does not exist or the user blocked the bot."""
+        return self.status_code in (400, 401, 403, 404)
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` operations per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns the seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            return max(0, -self.tokens / self.rate)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Drains the bucket so no token is available for `seconds`."""
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    @property
+    def is_full(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.updated_at
+            return self.tokens + elapsed * self.rate >= self.capacity
+
+
+class TelegramClient:
+    """Bot API client sending messages concurrently over pooled connections.
+
+    Outgoing messages are throttled by a global and a per-chat token bucket,
+    matching the Bot API limits, and a 429 response pauses the chat for the
+    `retry_after` the API asked for before the message is retried.
+    """
+
+    max_idle_chats = 10_000
+
+    def __init__(
+        self,
+        base_url=None,
+        token=None,
+        pool_size=None,
+        timeout=None,
+        global_rate=None,
+        chat_rate=None,
+        max_retries=None,
+    ):
+        self.url = (
+            f"{base_url or settings.TELEGRAM_URL}"
+            f"{token or settings.TELEGRAM_TOKEN}/sendMessage"
+        )
+        self.pool_size = pool_size or settings.TELEGRAM_POOL_SIZE
+        self.timeout = timeout or settings.TELEGRAM_TIMEOUT
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE
+        self.max_retries = (
+            settings.TELEGRAM_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.global_bucket = TokenBucket(global_rate or settings.TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.chat_buckets_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_chat_bucket(self, chat_id):
+        with self.chat_buckets_lock:
+            if len(self.chat_buckets) >= self.max_idle_chats:
+                self.chat_buckets = {
+                    key: bucket
+                    for key, bucket in self.chat_buckets.items()
+                    if not bucket.is_full
+                }
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            return bucket
+
+    def send_message(self, chat_id, message):
+        chat_bucket = self.get_chat_bucket(chat_id)
+        params = {
+            "text": message,
+            "chat_id": chat_id,
+        }
+        for attempt in range(self.max_retries + 1):
+            chat_bucket.acquire()
+            self.global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(
+                    self.url, params=params, timeout=self.timeout
+                )
+            except requests.RequestException as exc:
+                telegram_request_seconds.observe(
+                    ("error",), time.perf_counter() - started
+                )
+                raise TelegramError(str(exc)) from exc
+            telegram_request_seconds.observe(
+                (str(response.status_code),), time.perf_counter() - started
+            )
+
+            if response.status_code != 429:
+                break
+            retry_after = get_retry_after(response)
+            if attempt == self.max_retries:
+                raise TelegramError(
+                    "Too many requests", status_code=429, retry_after=retry_after
+                )
+            chat_bucket.pause(retry_after)
+
+        if not response.ok:
+            raise TelegramError(
+                f"Bot API responded with {response.status_code}",
+                status_code=response.status_code,
+            )
+
+    def send_messages(self, messages):
+        """Sends `(chat_id, message)` pairs concurrently.
+
+        Returns a list aligned with `messages` holding `None` for every
+        delivered message and the `TelegramError` for every failed one.
+        """
+
+        def send(item):
+            chat_id, message = item
+            try:
+                self.send_message(chat_id, message)
+            except TelegramError as exc:
+                logger.warning("Failed to send a message to %s: %s", chat_id, exc)
+                return exc
+
+        if len(messages) <= 1:
+            return [send(item) for item in messages]
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            return list(executor.map(send, messages))
+
+
+class CircuitBreaker:
+    """Circuit breaker shared by all dispatcher nodes through the cache.
 
-from config.settings import TELEGRAM_TOKEN, TELEGRAM_URL
+    After `threshold` failed batches in a row the circuit opens for
+    `reset_timeout` seconds. The first batch after that is a probe: one more
+    failure opens the circuit again, a success closes it.
+    """
+
+    def __init__(self, name, threshold=None, reset_timeout=None):
+        self.failures_key = f"circuit:{name}:failures"
+        self.open_key = f"circuit:{name}:open"
+        self.threshold = threshold or settings.TELEGRAM_CIRCUIT_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.TELEGRAM_CIRCUIT_RESET_TIMEOUT
+
+    def is_open(self):
+        return cache.get(self.open_key, False)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, timeout=None)
+        if cache.incr(self.failures_key) >= self.threshold:
+            logger.warning("Opening the %s circuit", self.open_key)
+            cache.set(self.open_key, True, timeout=self.reset_timeout)
+
+
+telegram_circuit = CircuitBreaker("telegram")
+
+
+def get_retry_after(response):
+    try:
+        return response.json()["parameters"]["retry_after"]
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_telegram_client():
+    """Returns the client shared by the current process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TelegramClient()
+        return _client
 
 
 def send_telegram_message(chat_id, message):
-    params = {
-        "text": message,
-        "chat_id": chat_id,
-    }
-    requests.get(f"{TELEGRAM_URL}{TELEGRAM_TOKEN}/sendMessage", params=params)
+    get_telegram_client().send_message(chat_id, message)
+
+
+def send_telegram_messages(messages):
+    return get_telegram_client().send_messages(messages)
+
+
+class CompletionBuffer:
+    """Redis list holding habit completions until they are written in bulk.
+
+    Entries are only removed with `trim` once written, so a flush that dies
+    halfway leaves them for the next one. Flushers hold a lock in the same
+    Redis and trim only while they still hold it, so one whose lock ran out
+    cannot drop entries its successor has read but not written.
+    """
+
+    key = "habits:completions"
+    lock_key = "habits:completions:flush"
+
+    # Trims and extends the lock in one step, for the lock's holder only
+    trim_script = """
+        if redis.call("GET", KEYS[2]) ~= ARGV[1] then
+            return 0
+        end
+        redis.call("LTRIM", KEYS[1], ARGV[2], -1)
+        redis.call("EXPIRE", KEYS[2], ARGV[3])
+        return 1
+    """
+    release_script = """
+        if redis.call("GET", KEYS[1]) == ARGV[1] then
+            return redis.call("DEL", KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+        self.trim_holding = self.redis.register_script(self.trim_script)
+        self.release_holding = self.redis.register_script(self.release_script)
+
+    def push(self, payload):
+        """Appends a completion and returns the number of buffered entries."""
+        return self.redis.rpush(self.key, json.dumps(payload))
+
+    def peek(self, count):
+        return [json.loads(item) for item in self.redis.lrange(self.key, 0, count - 1)]
+
+    def acquire(self, token, timeout):
+        """Takes the flush lock for `timeout` seconds; returns whether it
+        was free."""
+        return bool(self.redis.set(self.lock_key, token, nx=True, ex=timeout))
+
+    def trim(self, count, token, timeout):
+        """Drops the first `count` entries and extends the lock by `timeout`
+        seconds if `token` still holds it. Returns whether it did."""
+        return bool(
+            self.trim_holding(
+                keys=[self.key, self.lock_key], args=[token, count, timeout]
+            )
+        )
+
+    def release(self, token):
+        self.release_holding(keys=[self.lock_key], args=[token])
+
+
+_completion_buffer = None
+
+
+def get_completion_buffer():
+    """Returns the completion buffer, or `None` when COMPLETION_BUFFER_URL is
+    not set and completions are written as they arrive."""
+    global _completion_buffer
+    if not settings.COMPLETION_BUFFER_URL:
+        return None
+    if _completion_buffer is None:
+        _completion_buffer = CompletionBuffer(settings.COMPLETION_BUFFER_URL)
+    return _completion_buffer
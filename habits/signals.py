@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+
+from .caching import bump_versions, get_habit_version_keys
+from .models import Habit
+from .tasks import schedule_reminders
+
+
+@receiver(post_save, sender=User)
+def reschedule_reminders(sender, instance, created, update_fields, **kwargs):
+    """Moves the user's reminders when their timezone changes."""
+    if created or (update_fields is not None and "timezone" not in update_fields):
+        return
+    if not instance.timezone_changed():
+        return
+    previous_tz = getattr(instance, "_loaded_timezone", None)
+    habits = []
+    for habit in Habit.objects.filter(user=instance):
+        habit.user = instance
+        if habit.reschedule(previous_tz):
+            habits.append(habit)
+    Habit.objects.bulk_update(habits, ["next_fire_at"])
+    if habits:
+        next_fire_at = min(habit.next_fire_at for habit in habits)
+        transaction.on_commit(lambda: schedule_reminders(next_fire_at), robust=True)
+
+
+@receiver(post_save, sender=Habit)
+def schedule_reminder_run(sender, instance, **kwargs):
+    """Wakes the reminder task up in time for the habit's next reminder."""
+    next_fire_at = instance.next_fire_at
+    transaction.on_commit(lambda: schedule_reminders(next_fire_at), robust=True)
+
+
+@receiver(post_save, sender=Habit)
+def bump_habit_versions(sender, instance, **kwargs):
+    """Invalidates the cached versions of the habit and the lists holding it."""
+    keys = get_habit_version_keys(
+        instance, was_public=getattr(instance, "_loaded_is_public", False)
+    )
+    instance._loaded_is_public = instance.is_public
+    transaction.on_commit(lambda: bump_versions(keys), robust=True)
+
+
+@receiver(pre_delete, sender=Habit)
+def bump_related_habit_versions(sender, instance, **kwargs):
+    """Invalidates the habits that lose this one as their related habit."""
+    keys = []
+    for habit in Habit.objects.filter(related_habit=instance).only(
+        "user_id", "is_public"
+    ):
+        keys += get_habit_version_keys(habit)
+    if keys:
+        transaction.on_commit(lambda: bump_versions(keys), robust=True)
+
+
+@receiver(post_delete, sender=Habit)
+def bump_deleted_habit_versions(sender, instance, **kwargs):
+    keys = get_habit_version_keys(instance)
+    transaction.on_commit(lambda: bump_versions(keys), robust=True)
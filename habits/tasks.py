@@ -1,16 +1,351 @@
-from celery import shared_task
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from itertools import groupby
+from uuid import uuid4
+
+from celery import group, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min, Q
 from django.utils import timezone
 
-from .models import Habit
-from .services import send_telegram_message
+from users.models import DIGEST_WINDOW_CHOICES, User, get_utc_offset
+
+from .metrics import (habits_scanned, habits_skipped, notifications_handled,
+                      queue_lag_seconds, send_lag_seconds)
+from .models import Habit, HabitCompletion, HabitStats, Notification
+from .services import (get_completion_buffer, send_telegram_messages,
+                       telegram_circuit)
+
+NEXT_RUN_KEY = "reminders:next-run"
+# Seconds a flush holds the completion buffer, renewed with every batch
+FLUSH_LOCK_TIMEOUT = 60
+# Outcome of a delivery attempt, for the metrics
+OUTCOME_BY_STATUS = {
+    Notification.SENT: "sent",
+    Notification.FAILED: "failed",
+    Notification.PENDING: "retried",
+}
+
+
+def get_window_end(now, window):
+    """Returns the end of the `window`-minute digest window holding `now`."""
+    minutes = int(now.timestamp() // 60)
+    end = (minutes // window + 1) * window
+    return datetime.fromtimestamp(end * 60, tz=dt_timezone.utc)
+
+
+def get_due_habits(now):
+    """Returns the habits to remind about at `now`.
+
+    Users with a digest window get everything due until the end of the
+    current window at once.
+    """
+    due = Q(user__digest_window__isnull=True, next_fire_at__lte=now)
+    for window, _ in DIGEST_WINDOW_CHOICES:
+        due |= Q(
+            user__digest_window=window,
+            next_fire_at__lt=get_window_end(now, window),
+        )
+    return Habit.objects.filter(due)
+
+
+def split_into_shards(user_ids, shard_size):
+    """Cuts sorted user ids into `(first, last)` ranges of about `shard_size`
+    habits, never splitting one user's habits across two shards."""
+    shards = []
+    first = last = None
+    size = 0
+    for user_id in user_ids:
+        if size >= shard_size and user_id != last:
+            shards.append((first, last))
+            first, size = None, 0
+        if first is None:
+            first = user_id
+        last = user_id
+        size += 1
+    if first is not None:
+        shards.append((first, last))
+    return shards
+
+
+def build_reminders(habits, now):
+    """Combines habits sorted by user into one outbox notification per user
+    with a chat, due at `now`."""
+    notifications = []
+    for user, habits in groupby(habits, key=lambda habit: habit.user):
+        if not user.tg_chat_id:
+            continue
+        habits = list(habits)
+        if len(habits) == 1:
+            text = f"Time for your habit: {habits[0].action}"
+        else:
+            text = "Time for your habits:\n" + "\n".join(
+                f"{habit.time:%H:%M} {habit.action}" for habit in habits
+            )
+        notifications.append(
+            Notification(
+                user=user,
+                chat_id=user.tg_chat_id,
+                text=text,
+                next_attempt_at=now,
+                due_at=habits[0].next_fire_at,
+            )
+        )
+    return notifications
+
+
+def claim_notifications(limit):
+    """Leases up to `limit` due notifications to the calling dispatcher.
+
+    Rows locked by a concurrent dispatcher are skipped rather than waited
+    for, and a lease that ran out (its dispatcher died) can be taken over.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=[Notification.PENDING, Notification.SENDING],
+                next_attempt_at__lte=now,
+            )
+            .order_by("next_attempt_at")[:limit]
+        )
+        Notification.objects.filter(
+            pk__in=[notification.pk for notification in notifications]
+        ).update(
+            status=Notification.SENDING,
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE),
+        )
+    return notifications
+
+
+def get_retry_delay(attempts):
+    delay = settings.NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.NOTIFICATION_MAX_RETRY_DELAY))
+
+
+def deliver_notifications(notifications):
+    """Sends claimed notifications and records the outcome of each."""
+    errors = send_telegram_messages(
+        [(notification.chat_id, notification.text) for notification in notifications]
+    )
+    now = timezone.now()
+    for notification, error in zip(notifications, errors):
+        notification.attempts += 1
+        notification.last_error = str(error or "")
+        if error is None:
+            notification.status = Notification.SENT
+            notification.sent_at = now
+            if notification.due_at is not None:
+                send_lag_seconds.observe(
+                    (), max(0, (now - notification.due_at).total_seconds())
+                )
+        elif (
+            error.is_permanent
+            or notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS
+        ):
+            notification.status = Notification.FAILED
+        else:
+            notification.status = Notification.PENDING
+            notification.next_attempt_at = now + get_retry_delay(notification.attempts)
+        notifications_handled.inc((OUTCOME_BY_STATUS[notification.status],))
+    Notification.objects.bulk_update(
+        notifications,
+        ["status", "attempts", "last_error", "next_attempt_at", "sent_at"],
+    )
+
+    if any(error is None for error in errors):
+        telegram_circuit.record_success()
+    elif any(not error.is_permanent for error in errors):
+        telegram_circuit.record_failure()
+
+
+def schedule_reminders(at):
+    """Makes sure `send_reminders` runs by `at`.
+
+    Runs are enqueued with an ETA instead of polling every minute; a run
+    already scheduled at or before `at` is reused. The wait is capped at
+    REMINDER_INTERVAL, so a lost ETA task delays reminders no longer than
+    the beat schedule that backs it up.
+    """
+    if at is None:
+        return
+    at = min(at, timezone.now() + timedelta(minutes=settings.REMINDER_INTERVAL))
+    scheduled = cache.get(NEXT_RUN_KEY)
+    if scheduled is not None and scheduled <= at:
+        return
+    cache.set(NEXT_RUN_KEY, at, timeout=settings.REMINDER_INTERVAL * 60)
+    send_reminders.apply_async(eta=at)
 
 
 @shared_task
 def send_reminders():
+    """Sends the reminders of every habit whose `next_fire_at` has passed.
+
+    Habits missed by a late or skipped run stay due until a run picks them
+    up. The due habits are split into user-id ranges and fanned out to the
+    workers as a group of `queue_reminder_shard` tasks; then the next run is
+    scheduled for the earliest upcoming reminder.
+    """
+    now = timezone.now()
+    scheduled = cache.get(NEXT_RUN_KEY)
+    if scheduled is not None and scheduled <= now:
+        cache.delete(NEXT_RUN_KEY)
+
+    user_ids = get_due_habits(now).order_by("user_id").values_list("user_id", flat=True)
+    shards = split_into_shards(user_ids.iterator(), settings.REMINDER_SHARD_SIZE)
+    if len(shards) == 1:
+        queue_reminder_shard(*shards[0])
+    elif shards:
+        group(
+            queue_reminder_shard.s(first, last) for first, last in shards
+        ).apply_async()
+
+    upcoming = Habit.objects.filter(next_fire_at__gt=now).aggregate(
+        next_fire_at=Min("next_fire_at")
+    )
+    schedule_reminders(upcoming["next_fire_at"])
+
+
+@shared_task
+def queue_reminder_shard(first_user_id, last_user_id):
+    """Writes the reminders of one user-id range to the outbox, moves the
+    habits on to their next reminder and starts a dispatcher once both are
+    committed.
+
+    The due habits are locked, skipping those a concurrent run holds, so no
+    reminder is queued twice. Reminders more than REMINDER_MAX_CATCHUP
+    minutes late are dropped rather than sent.
+    """
     now = timezone.now()
-    habits = Habit.objects.filter(time__hour=now.hour, time__minute=now.minute)
-    for habit in habits:
-        send_telegram_message(
-            chat_id=habit.user.tg_chat_id,
-            message=f"Time for your habit: {habit.action}",
+    stale_before = now - timedelta(minutes=settings.REMINDER_MAX_CATCHUP)
+    with transaction.atomic():
+        habits = list(
+            get_due_habits(now)
+            .filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+            .select_related("user")
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("user_id", "next_fire_at", "id")
         )
+        due_habits = [habit for habit in habits if habit.next_fire_at >= stale_before]
+        notifications = build_reminders(due_habits, now)
+        habits_scanned.inc(amount=len(habits))
+        habits_skipped.inc(amount=len(habits) - len(due_habits))
+        for habit in due_habits:
+            queue_lag_seconds.observe(
+                (), max(0, (now - habit.next_fire_at).total_seconds())
+            )
+        for habit in habits:
+            habit.advance(now)
+        Habit.objects.bulk_update(habits, ["next_fire_at"], batch_size=500)
+        Notification.objects.bulk_create(notifications)
+        transaction.on_commit(dispatch_notifications.delay)
+
+
+@shared_task
+def dispatch_notifications():
+    """Drains the outbox batch by batch until nothing is due.
+
+    Any number of dispatchers may run at once; each claims its own batches.
+    Dispatch stops while the Telegram circuit is open and is picked up again
+    by the next scheduled run.
+    """
+    while not telegram_circuit.is_open():
+        notifications = claim_notifications(settings.NOTIFICATION_BATCH_SIZE)
+        if not notifications:
+            break
+        deliver_notifications(notifications)
+
+
+@shared_task
+def refresh_utc_offsets():
+    """Follows timezone rule changes.
+
+    Re-reads the current offset of every timezone in use and, when it
+    differs from the one stored for its users, recomputes their habits'
+    `next_fire_at` under the current rules.
+    """
+    timezones = User.objects.order_by().values_list("timezone", flat=True).distinct()
+    for tz in timezones:
+        utc_offset = get_utc_offset(tz)
+        users = User.objects.filter(timezone=tz).exclude(utc_offset=utc_offset)
+        if not users.update(utc_offset=utc_offset):
+            continue
+        habits = Habit.objects.filter(user__timezone=tz).select_related("user")
+        habits = [habit for habit in habits.iterator() if habit.reschedule()]
+        Habit.objects.bulk_update(habits, ["next_fire_at"], batch_size=500)
+        if habits:
+            schedule_reminders(min(habit.next_fire_at for habit in habits))
+
+
+def record_completions(completions):
+    """Writes habit completions in bulk and advances the streaks of their
+    habits.
+
+    Completions of deleted habits and repeats of a habit on the same day are
+    dropped, so writing the same completions twice is harmless. So are
+    completions dated before the habit's last one, which the streaks could
+    no longer count.
+    """
+    habit_ids = set(
+        Habit.objects.filter(
+            pk__in={completion.habit_id for completion in completions}
+        ).values_list("pk", flat=True)
+    )
+    completions = [
+        completion for completion in completions if completion.habit_id in habit_ids
+    ]
+    with transaction.atomic():
+        HabitStats.objects.bulk_create(
+            (HabitStats(habit_id=habit_id) for habit_id in habit_ids),
+            ignore_conflicts=True,
+        )
+        stats = {
+            habit_stats.habit_id: habit_stats
+            for habit_stats in HabitStats.objects.select_for_update()
+            .select_related("habit")
+            .filter(habit_id__in=habit_ids)
+        }
+        completions = [
+            completion
+            for completion in completions
+            if stats[completion.habit_id].last_done is None
+            or completion.completed_on >= stats[completion.habit_id].last_done
+        ]
+        HabitCompletion.objects.bulk_create(completions, ignore_conflicts=True)
+        for completion in sorted(completions, key=lambda item: item.completed_on):
+            stats[completion.habit_id].add(completion.completed_on)
+        HabitStats.objects.bulk_update(
+            stats.values(), ["current_streak", "best_streak", "last_done"]
+        )
+
+
+@shared_task
+def flush_completions():
+    """Moves buffered habit completions to the database batch by batch, at
+    most COMPLETION_FLUSH_BATCHES batches per run.
+
+    Only one flush runs at a time. The entries of a batch leave the buffer
+    once they are committed, and only while the flush still holds the lock;
+    otherwise its successor writes them again, which does no harm. A run
+    that stops with entries left queues the next one.
+    """
+    buffer = get_completion_buffer()
+    token = uuid4().hex
+    if buffer is None or not buffer.acquire(token, FLUSH_LOCK_TIMEOUT):
+        return
+    try:
+        for _ in range(settings.COMPLETION_FLUSH_BATCHES):
+            payloads = buffer.peek(settings.COMPLETION_BATCH_SIZE)
+            if not payloads:
+                return
+            record_completions(
+                [HabitCompletion.from_payload(payload) for payload in payloads]
+            )
+            if not buffer.trim(len(payloads), token, FLUSH_LOCK_TIMEOUT):
+                return
+    finally:
+        buffer.release(token)
+    flush_completions.delay()
@@ -1,26 +1,55 @@
 import datetime
-from unittest.mock import patch
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest.mock import Mock, patch
 from urllib.parse import urlparse
 
 import requests_mock
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.sqlite3 import base as sqlite3_base
+from django.db.models import F
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
 from rest_framework.serializers import ValidationError
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
+from config.celery import app as celery_app
+from config.db.base import MeteredDatabaseWrapperMixin
+from config.metrics import (PROCESSES_KEY, WORKERS_KEY, Histogram,
+                            connection_stats, expose, get_process_name,
+                            get_worker_key, publish_metrics, request_seconds,
+                            task_seconds)
 from config.settings import TELEGRAM_TOKEN, TELEGRAM_URL
-from habits.services import send_telegram_message
+from habits.metrics import (habits_scanned, notifications_handled,
+                            send_lag_seconds, telegram_request_seconds)
+from habits.serializers import (HabitSerializer, serialize_habit,
+                                serialize_habits)
+from habits.services import (CircuitBreaker, TelegramClient, TelegramError,
+                             TokenBucket, send_telegram_message)
 from habits.validators import (validate_connected_habit_and_reward,
                                validate_connected_habit_nature,
                                validate_habit_duration,
                                validate_habit_periodicity,
                                validate_pleasant_habit)
-from users.models import User
+from users.models import User, get_utc_offset
 
-from .models import Habit
-from .tasks import send_reminders
+from .caching import (PUBLIC_FEED_LOCK_KEY, PUBLIC_HABITS_KEY, bump_versions,
+                      get_public_feed, get_versions)
+from .models import Habit, HabitCompletion, HabitStats, Notification
+from .tasks import (NEXT_RUN_KEY, dispatch_notifications, flush_completions,
+                    record_completions, refresh_utc_offsets,
+                    schedule_reminders, send_reminders, split_into_shards)
 
 
 class HabitTestCase(APITestCase):
@@ -28,6 +57,11 @@ class HabitTestCase(APITestCase):
     def setUp(self):
         self.user = User.objects.create(email="test@sky.pro")
         self.client.force_authenticate(user=self.user)
+        cache.clear()
+        # Keep committed habit changes from scheduling reminder runs.
+        patcher = patch("habits.signals.schedule_reminders")
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def create_habit(
         self,
@@ -39,9 +73,11 @@ class HabitTestCase(APITestCase):
         reward="",
         duration=60,
         is_public=False,
+        related_habit=None,
     ):
         return Habit.objects.create(
             user=self.user,
+            related_habit=related_habit,
             location=location,
             time=time,
             action=action,
@@ -88,6 +124,391 @@ class HabitTestCase(APITestCase):
         self.assertIn("Drink water", habit_names)
         self.assertEqual(response.data["results"][0]["action"], "Drink water")
 
+    @override_settings(SHARED_CACHE=True)
+    def test_habits_list_is_ordered(self):
+        other = User.objects.create(email="other@sky.pro")
+        first = self.create_habit(action="Walk")
+        public = self.create_habit(action="Read", is_public=True)
+        Habit.objects.filter(pk=public.pk).update(user=other)
+        Habit.objects.filter(pk=self.create_habit().pk).update(user=other)
+        last = self.create_habit(action="Stretch")
+
+        # The public habits are queried once and shared through the cache.
+        with self.assertNumQueries(2):
+            self.client.get(reverse("habits:habit-list"))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("habits:habit-list"))
+
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(
+            [habit["id"] for habit in response.data["results"]],
+            [first.pk, public.pk, last.pk],
+        )
+
+    def test_public_feed_needs_a_shared_cache(self):
+        public = self.create_habit(is_public=True)
+        self.client.get(reverse("habits:habit-list"))
+
+        # Another process changing the habit bumps its own cache only.
+        Habit.objects.filter(pk=public.pk).update(action="Walk")
+        response = self.client.get(reverse("habits:habit-list"))
+
+        self.assertEqual(response.data["results"][0]["action"], "Walk")
+
+    @override_settings(SHARED_CACHE=True, PUBLIC_FEED_SIZE=2)
+    def test_habits_list_pages_past_public_feed(self):
+        other = User.objects.create(email="other@sky.pro")
+        habits = []
+        for index in range(7):
+            habit = self.create_habit(action=f"habit {index}", is_public=index % 2)
+            if habit.is_public:
+                Habit.objects.filter(pk=habit.pk).update(user=other)
+            habits.append(habit)
+
+        ids = []
+        url = reverse("habits:habit-list") + "?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.data["count"], 7)
+            ids += [habit["id"] for habit in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(ids, [habit.pk for habit in habits])
+        (version,) = get_versions([PUBLIC_HABITS_KEY])
+        feed = cache.get(f"habits:public-feed:{version}")
+        self.assertEqual(len(feed["habits"]), 2)
+        self.assertEqual(feed["count"], 3)
+
+    def test_habits_list_cursor_pagination(self):
+        habits = [self.create_habit(action=f"habit {index}") for index in range(7)]
+        url = reverse("habits:habit-list") + "?pagination=cursor&page_size=3"
+
+        ids = []
+        while url:
+            # No count query, however deep the page
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertNotIn("count", response.data)
+            ids += [habit["id"] for habit in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(ids, [habit.pk for habit in habits])
+        self.assertIsNotNone(response.data["previous"])
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_habits_list_conditional_get(self):
+        url = reverse("habits:habit-list")
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        self.assertNotIn("Last-Modified", response.headers)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Another user publishing a habit changes the list.
+        with self.captureOnCommitCallbacks(execute=True):
+            other = User.objects.create(email="other@sky.pro")
+            habit = self.create_habit(is_public=True)
+            habit.user = other
+            habit.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+
+        # So does making it private again.
+        etag = response.headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.is_public = False
+            habit.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.data["count"], 0)
+
+    def test_conditional_get_needs_a_shared_cache(self):
+        response = self.client.get(reverse("habits:habit-list"))
+        self.assertNotIn("ETag", response.headers)
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_habit_retrieve_conditional_get(self):
+        habit = self.create_habit()
+        url = reverse("habits:habit-detail", args=[habit.pk])
+        etag = self.client.get(url).headers["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                url, {"action": "Stretch", "periodicity": 1}, format="json"
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["action"], "Stretch")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response.headers["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_list_is_documented_as_a_list(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+
+        operation = schema["paths"]["/habits/habits/async/"]["get"]
+        self.assertEqual(operation["operationId"], "habits_habits_async_list")
+        self.assertIn(
+            "page", [parameter["name"] for parameter in operation["parameters"]]
+        )
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_async_views_match_sync_views(self):
+        other = User.objects.create(email="other@sky.pro")
+        own = self.create_habit()
+        public = self.create_habit(action="Walk", is_public=True)
+        public.user = other
+        public.save()
+        private = self.create_habit(action="Read")
+        private.user = other
+        private.save()
+
+        for params in [{}, {"fields": "id,action"}, {"is_public": "true"}]:
+            for mode in [{}, {"pagination": "cursor"}]:
+                response = self.client.get(
+                    reverse("habits:habit-list-async"), {**params, **mode}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    response.data["results"],
+                    self.client.get(
+                        reverse("habits:habit-list"), {**params, **mode}
+                    ).data["results"],
+                )
+
+        for habit in [own, public]:
+            url = reverse("habits:habit-detail-async", args=[habit.pk])
+            response = self.client.get(url)
+            self.assertEqual(
+                response.data,
+                self.client.get(reverse("habits:habit-detail", args=[habit.pk])).data,
+            )
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(
+            reverse("habits:habit-detail-async", args=[private.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse("habits:habit-list-async"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_public_feed_is_rebuilt_once(self):
+        build = Mock(return_value=[{"id": 1}])
+        self.assertEqual(get_public_feed(build), [{"id": 1}])
+        self.assertEqual(get_public_feed(build), [{"id": 1}])
+        build.assert_called_once()
+
+        # While another request rebuilds the feed, wait for its result.
+        bump_versions([PUBLIC_HABITS_KEY])
+        cache.add(PUBLIC_FEED_LOCK_KEY, True)
+        (version,) = get_versions([PUBLIC_HABITS_KEY])
+
+        def rebuilt_elsewhere(seconds):
+            cache.set(f"habits:public-feed:{version}", [{"id": 2}])
+
+        with patch("habits.caching.time.sleep", side_effect=rebuilt_elsewhere):
+            self.assertEqual(get_public_feed(build), [{"id": 2}])
+        build.assert_called_once()
+
+    def test_serialize_habit_matches_habit_serializer(self):
+        pleasant = self.create_habit(action="Take a bath")
+        habit = self.create_habit(
+            is_pleasant=False, related_habit=pleasant, time="07:30:15"
+        )
+        habit.refresh_from_db()
+
+        self.assertEqual(serialize_habit(vars(habit)), HabitSerializer(habit).data)
+        self.assertEqual(
+            serialize_habits(Habit.objects.order_by("id")),
+            HabitSerializer(Habit.objects.order_by("id"), many=True).data,
+        )
+
+    def habit_data(self, **kwargs):
+        return {
+            "location": "Kitchen",
+            "time": "09:00",
+            "action": "Drink water",
+            "is_pleasant": False,
+            "duration": 60,
+            **kwargs,
+        }
+
+    def test_batch_create(self):
+        url = reverse("habits:habit-batch")
+        bath = self.create_habit(action="Take a bath")
+
+        def create(count):
+            items = [self.habit_data(related_habit=bath.pk) for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, items, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return response, len(queries)
+
+        response, queries = create(2)
+        self.assertEqual(
+            [habit["related_habit"] for habit in response.data], [bath.pk] * 2
+        )
+        self.assertEqual(Habit.objects.filter(related_habit=bath).count(), 2)
+        # The cost of a batch does not grow with its size.
+        self.assertEqual(create(12)[1], queries)
+
+    def test_batch_create_reports_failing_items(self):
+        items = [
+            self.habit_data(),
+            self.habit_data(duration=200),
+            self.habit_data(is_pleasant=True, reward="Dessert"),
+            self.habit_data(related_habit=999),
+        ]
+
+        response = self.client.post(reverse("habits:habit-batch"), items, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error["index"] for error in response.data["errors"]], [1, 2, 3]
+        )
+        self.assertIn("related_habit", response.data["errors"][2]["errors"])
+        self.assertFalse(Habit.objects.exists())
+
+    def test_batch_update(self):
+        url = reverse("habits:habit-batch")
+        first, second = self.create_habit(), self.create_habit()
+        other = Habit.objects.create(
+            user=User.objects.create(email="other@sky.pro"), **self.habit_data()
+        )
+
+        response = self.client.patch(
+            url,
+            [{"id": first.pk, "action": "Stretch"}, {"id": other.pk, "action": "Run"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["errors"],
+            [{"index": 1, "id": other.pk, "errors": {"id": ["Habit not found."]}}],
+        )
+
+        response = self.client.patch(
+            url,
+            [{"id": [first.pk], "action": "Run"}, {"id": True, "action": "Run"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error["errors"] for error in response.data["errors"]],
+            [{"id": ["Expected a habit id."]}] * 2,
+        )
+
+        # The whole habit is validated, not only the changed fields.
+        response = self.client.patch(
+            url, [{"id": first.pk, "reward": "Dessert"}], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(
+            url,
+            [
+                {"id": first.pk, "action": "Stretch", "time": "23:59"},
+                {"id": second.pk, "is_public": True},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        self.assertEqual(first.action, "Stretch")
+        self.assertEqual(
+            first.next_fire_at.astimezone(datetime.timezone.utc).time(),
+            datetime.time(23, 59),
+        )
+        self.assertTrue(Habit.objects.get(pk=second.pk).is_public)
+        self.assertEqual(Habit.objects.get(pk=other.pk).action, "Drink water")
+
+    def test_batch_get_and_delete(self):
+        url = reverse("habits:habit-batch")
+        first, second = self.create_habit(), self.create_habit()
+
+        response = self.client.get(url, {"ids": f"{first.pk},{second.pk},999"})
+        self.assertEqual(
+            [habit["id"] for habit in response.data["results"]], [first.pk, second.pk]
+        )
+        self.assertEqual(response.data["not_found"], [999])
+
+        response = self.client.delete(url, {"ids": [first.pk, 999]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Habit.objects.count(), 2)
+
+        response = self.client.delete(
+            url, {"ids": [first.pk, second.pk]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Habit.objects.exists())
+
+    def test_sparse_fieldsets(self):
+        habit = self.create_habit(is_public=True)
+        self.create_habit(action="Walk")
+        list_url = reverse("habits:habit-list")
+
+        response = self.client.get(list_url, {"fields": "action,time"})
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"action": "Drink water", "time": "09:00:00"},
+                {"action": "Walk", "time": "09:00:00"},
+            ],
+        )
+        response = self.client.get(
+            list_url, {"fields": "id,action", "pagination": "cursor"}
+        )
+        self.assertEqual(
+            response.data["results"][0], {"id": habit.pk, "action": "Drink water"}
+        )
+
+        url = reverse("habits:habit-detail", args=[habit.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"exclude": "location,reward,user"})
+        self.assertNotIn("location", response.data)
+        self.assertIn("action", response.data)
+        self.assertNotIn('"location"', queries[0]["sql"])
+
+    def test_habits_list_filters(self):
+        other = User.objects.create(email="other@sky.pro")
+        early = self.create_habit(time="06:30")
+        morning = self.create_habit(time="08:00", location="Park")
+        evening = self.create_habit(time="20:00", is_pleasant=False)
+        public = Habit.objects.create(
+            user=other, **self.habit_data(time="07:30", is_public=True)
+        )
+        url = reverse("habits:habit-list")
+
+        def filtered(**params):
+            response = self.client.get(url, params)
+            return [habit["id"] for habit in response.data["results"]]
+
+        self.assertEqual(
+            filtered(time_after="07:00", time_before="09:00"), [morning.pk, public.pk]
+        )
+        self.assertEqual(
+            filtered(time_after="07:00", time_before="09:00", mine="true"), [morning.pk]
+        )
+        self.assertEqual(filtered(mine="false"), [public.pk])
+        self.assertEqual(filtered(is_pleasant="false"), [evening.pk, public.pk])
+        self.assertEqual(filtered(location="Park"), [morning.pk])
+        self.assertEqual(
+            filtered(is_public="false", periodicity=1),
+            [early.pk, morning.pk, evening.pk],
+        )
+
     def test_update_habit(self):
         """Habit update test."""
 
@@ -185,6 +606,194 @@ class HabitTestCase(APITestCase):
         self.assertEqual(habit.is_public, True)
 
 
+class ListBuffer:
+    """In-memory stand-in for the Redis completion buffer."""
+
+    def __init__(self):
+        self.items = []
+        self.lock = None
+
+    def push(self, payload):
+        self.items.append(payload)
+        return len(self.items)
+
+    def peek(self, count):
+        return self.items[:count]
+
+    def acquire(self, token, timeout):
+        if self.lock is not None:
+            return False
+        self.lock = token
+        return True
+
+    def trim(self, count, token, timeout):
+        if self.lock != token:
+            return False
+        del self.items[:count]
+        return True
+
+    def release(self, token):
+        if self.lock == token:
+            self.lock = None
+
+
+class HabitCompletionTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="test@sky.pro")
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            location="Kitchen",
+            time="09:00",
+            action="Drink water",
+            is_pleasant=True,
+            duration=60,
+        )
+
+    def complete(self, days_ago=0, habit=None):
+        url = reverse("habits:habit-complete", args=[(habit or self.habit).pk])
+        completed_at = timezone.now() - datetime.timedelta(days=days_ago)
+        return self.client.post(url, {"completed_at": completed_at}, format="json")
+
+    def test_complete_habit(self):
+        for days_ago in (3, 1, 0, 0):
+            response = self.complete(days_ago)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(HabitCompletion.objects.count(), 3)
+        response = self.client.get(reverse("habits:habit-stats", args=[self.habit.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["current_streak"], 2)
+        self.assertEqual(response.data["best_streak"], 2)
+        self.assertEqual(response.data["last_done"], str(timezone.now().date()))
+
+    def test_complete_habit_before_last_completion(self):
+        self.complete()
+
+        response = self.complete(days_ago=2)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("completed_at", response.data)
+        self.assertEqual(HabitCompletion.objects.count(), 1)
+
+    def test_record_completions_drops_completions_before_last_done(self):
+        today = timezone.now()
+        record_completions(
+            [
+                HabitCompletion(
+                    habit=self.habit, completed_at=today, completed_on=today.date()
+                )
+            ]
+        )
+        yesterday = today - datetime.timedelta(days=1)
+        record_completions(
+            [
+                HabitCompletion(
+                    habit=self.habit,
+                    completed_at=yesterday,
+                    completed_on=yesterday.date(),
+                )
+            ]
+        )
+
+        self.assertEqual(HabitCompletion.objects.count(), 1)
+        self.assertEqual(HabitStats.objects.get().current_streak, 1)
+
+    def test_complete_habit_of_another_user(self):
+        habit = Habit.objects.create(
+            user=User.objects.create(email="other@sky.pro"),
+            location="Kitchen",
+            time="09:00",
+            action="Drink water",
+            is_pleasant=True,
+            duration=60,
+            is_public=True,
+        )
+
+        response = self.complete(habit=habit)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("habits:habit-stats", args=[habit.pk]))
+        self.assertEqual(response.data["current_streak"], 0)
+
+    @override_settings(COMPLETION_BATCH_SIZE=2)
+    def test_complete_habit_is_buffered(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        buffer = ListBuffer()
+
+        with patch("habits.views.get_completion_buffer", return_value=buffer), patch(
+            "habits.tasks.get_completion_buffer", return_value=buffer
+        ):
+            response = self.complete(days_ago=1)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertFalse(HabitCompletion.objects.exists())
+
+            # The second completion fills a batch and flushes the buffer.
+            self.complete()
+
+        self.assertEqual(buffer.items, [])
+        self.assertEqual(HabitCompletion.objects.count(), 2)
+        self.assertEqual(HabitStats.objects.get().current_streak, 2)
+
+    @override_settings(COMPLETION_BATCH_SIZE=1, COMPLETION_FLUSH_BATCHES=1)
+    def test_flush_completions_is_bounded(self):
+        buffer = ListBuffer()
+        for days_ago in (1, 0):
+            completed_at = timezone.now() - datetime.timedelta(days=days_ago)
+            buffer.push(
+                HabitCompletion(
+                    habit=self.habit,
+                    completed_at=completed_at,
+                    completed_on=completed_at.date(),
+                ).to_payload()
+            )
+
+        with patch("habits.tasks.get_completion_buffer", return_value=buffer), patch(
+            "habits.tasks.flush_completions.delay"
+        ) as delay:
+            flush_completions()
+
+        self.assertEqual(len(buffer.items), 1)
+        self.assertIsNone(buffer.lock)
+        delay.assert_called_once_with()
+
+    def test_flush_completions_keeps_entries_after_losing_the_lock(self):
+        buffer = ListBuffer()
+        completed_at = timezone.now()
+        buffer.push(
+            HabitCompletion(
+                habit=self.habit,
+                completed_at=completed_at,
+                completed_on=completed_at.date(),
+            ).to_payload()
+        )
+
+        def lose_lock(completions):
+            # The lock runs out and another flush takes it over.
+            buffer.lock = "other"
+
+        with patch("habits.tasks.get_completion_buffer", return_value=buffer), patch(
+            "habits.tasks.record_completions", side_effect=lose_lock
+        ):
+            flush_completions()
+
+        self.assertEqual(len(buffer.items), 1)
+        self.assertEqual(buffer.lock, "other")
+
+    def test_streak_follows_periodicity(self):
+        self.habit.periodicity = 2
+        stats = HabitStats(habit=self.habit)
+        start = datetime.date(2024, 9, 2)
+        for days in (0, 2, 3, 6):
+            stats.add(start + datetime.timedelta(days))
+
+        self.assertEqual(stats.current_streak, 1)
+        self.assertEqual(stats.best_streak, 3)
+        self.assertEqual(stats.get_current_streak(start + datetime.timedelta(8)), 1)
+        self.assertEqual(stats.get_current_streak(start + datetime.timedelta(9)), 0)
+
+
 class TestValidators(TestCase):
     # test for validate_connected_habit_and_reward
     def test_validate_connected_habit_and_reward_both_present(self):
@@ -277,27 +886,642 @@ class ServicesTestCase(TestCase):
             parsed_actual_url = urlparse(m.last_request.url)._replace(query=None)
             assert parsed_actual_url.geturl() == url
 
+    def test_telegram_latency_is_recorded(self):
+        before = telegram_request_seconds.snapshot().get(("200",), {"count": 0})
+
+        with requests_mock.Mocker() as m:
+            m.get(f"{TELEGRAM_URL}{TELEGRAM_TOKEN}/sendMessage", json={"ok": True})
+            send_telegram_message("chat_id", "message")
+
+        after = telegram_request_seconds.snapshot()[("200",)]
+        self.assertEqual(after["count"], before["count"] + 1)
+
+    def test_send_messages_honours_retry_after(self):
+        client = TelegramClient(base_url="http://telegram.test/bot", token="token")
+        url = "http://telegram.test/bottoken/sendMessage"
+
+        with requests_mock.Mocker() as m, patch("habits.services.time.sleep") as sleep:
+            m.get(
+                url,
+                [
+                    {
+                        "status_code": 429,
+                        "json": {"ok": False, "parameters": {"retry_after": 3}},
+                    },
+                    {"json": {"ok": True}},
+                ],
+            )
+            errors = client.send_messages([("chat_id", "message")])
+
+            self.assertEqual(errors, [None])
+            self.assertEqual(m.call_count, 2)
+            self.assertGreaterEqual(max(c.args[0] for c in sleep.call_args_list), 2)
+
+    def test_send_messages_reports_failures_per_message(self):
+        client = TelegramClient(base_url="http://telegram.test/bot", token="token")
+        url = "http://telegram.test/bottoken/sendMessage"
+
+        with requests_mock.Mocker() as m:
+            m.get(url, json={"ok": True})
+            m.get(f"{url}?chat_id=blocked", status_code=403, complete_qs=False)
+            errors = client.send_messages(
+                [("first", "message"), ("blocked", "message"), ("last", "message")]
+            )
+
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], TelegramError)
+        self.assertIsNone(errors[2])
+
+    def test_token_bucket_throttles_after_capacity(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+
 
 @override_settings(CELERY_ALWAYS_EAGER=True)
 class TasksTestCase(TestCase):
-    @patch("habits.tasks.send_telegram_message")
-    def test_send_reminders(self, send_telegram_message_mock):
-        now_time = timezone.now()
-        habit_time = datetime.time(hour=now_time.hour, minute=now_time.minute)
+    def setUp(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        patcher = patch(
+            "habits.tasks.send_telegram_messages",
+            side_effect=lambda messages: [None] * len(messages),
+        )
+        self.send_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send_reminders(self):
+        # Run the dispatchers started once the outbox rows are committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            send_reminders()
+
+    def test_send_reminders(self):
+        user = User.objects.create(email="email", tg_chat_id="tg_chat_id")
+        habit = Habit.objects.create(
+            time="10:00", user=user, action="action", is_pleasant=True, duration=60
+        )
+        Habit.objects.update(next_fire_at=timezone.now())
+
+        self.send_reminders()
+
+        self.send_mock.assert_called_once_with(
+            [("tg_chat_id", "Time for your habit: action")]
+        )
+        habit.refresh_from_db()
+        self.assertGreater(habit.next_fire_at, timezone.now())
+
+    def test_send_reminders_records_telemetry(self):
+        user = User.objects.create(email="email", tg_chat_id="tg_chat_id")
+        Habit.objects.create(
+            time="10:00", user=user, action="action", is_pleasant=True, duration=60
+        )
+        due_at = timezone.now() - datetime.timedelta(minutes=2)
+        Habit.objects.update(next_fire_at=due_at)
+        scanned = habits_scanned.snapshot().get((), 0)
+        sent = notifications_handled.snapshot().get(("sent",), 0)
+        lag = send_lag_seconds.snapshot().get((), {"sum": 0, "count": 0})
+
+        with self.assertLogs("config.celery", "INFO") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                send_reminders.apply()
+
+        self.assertEqual(Notification.objects.get().due_at, due_at)
+        self.assertEqual(habits_scanned.snapshot()[()], scanned + 1)
+        self.assertEqual(notifications_handled.snapshot()[("sent",)], sent + 1)
+        self.assertEqual(send_lag_seconds.snapshot()[()]["count"], lag["count"] + 1)
+        self.assertGreaterEqual(
+            send_lag_seconds.snapshot()[()]["sum"] - lag["sum"], 120
+        )
+        self.assertIn(
+            ("habits.tasks.send_reminders", "SUCCESS"), task_seconds.snapshot()
+        )
+        self.assertTrue(
+            any("reminder_habits_scanned_total=1" in line for line in logs.output)
+        )
+        self.assertTrue(
+            any('notifications_total{outcome="sent"}=1' in line for line in logs.output)
+        )
+
+    def test_worker_metrics_are_exposed(self):
+        cache.clear()
+        notifications_handled.inc(("sent",))
+        publish_metrics("worker-1:42")
 
-        with timezone.override("UTC"):
-            user = User.objects.create(email="email", tg_chat_id="tg_chat_id")
+        self.assertIn(
+            'notifications_total{outcome="sent",worker="worker-1:42"}', expose()
+        )
+
+        cache.delete(get_worker_key("worker-1:42"))
+        self.assertNotIn('worker="worker-1:42"', expose())
+        self.assertEqual(cache.get(WORKERS_KEY), set())
+
+    def test_web_process_metrics_are_merged(self):
+        cache.clear()
+        request_seconds.observe(("habits:habit-list", "GET"), 0.1)
+        publish_metrics("web-2:7", label="process")
+
+        metrics = expose()
+
+        self.assertIn(
+            'http_request_duration_seconds_count{view="habits:habit-list",'
+            'method="GET",process="web-2:7"}',
+            metrics,
+        )
+        self.assertIn(f'process="{get_process_name()}"', metrics)
+        self.assertEqual(cache.get(PROCESSES_KEY), {"web-2:7", get_process_name()})
+
+    def test_send_reminders_skips_users_without_chat_id(self):
+        for email, tg_chat_id in (("a@sky.pro", None), ("b@sky.pro", "")):
             Habit.objects.create(
-                time=habit_time,
-                user=user,
+                time="10:00",
+                user=User.objects.create(email=email, tg_chat_id=tg_chat_id),
                 action="action",
                 is_pleasant=True,
                 duration=60,
             )
+        Habit.objects.update(next_fire_at=timezone.now())
 
-            send_reminders()
+        self.send_reminders()
+
+        self.send_mock.assert_not_called()
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(Habit.objects.filter(next_fire_at__lte=timezone.now()))
+
+    @override_settings(REMINDER_SHARD_SIZE=2)
+    def test_send_reminders_fans_out_shards(self):
+        for index in range(3):
+            user = User.objects.create(email=f"{index}@sky.pro", tg_chat_id=index)
+            for action in ("first", "second"):
+                Habit.objects.create(
+                    time="10:00",
+                    user=user,
+                    action=action,
+                    is_pleasant=True,
+                    duration=60,
+                )
+        Habit.objects.update(next_fire_at=timezone.now())
+
+        self.send_reminders()
+
+        sent = [
+            message
+            for call in self.send_mock.call_args_list
+            for message in call.args[0]
+        ]
+        self.assertEqual(sorted(chat_id for chat_id, _ in sent), ["0", "1", "2"])
+        self.assertEqual(
+            Notification.objects.filter(status=Notification.SENT).count(), 3
+        )
+
+    def create_habit(self, time, user, action="action", created_at=None, **kwargs):
+        with patch(
+            "habits.models.timezone.now", return_value=created_at or self.at(0, 0)
+        ):
+            return Habit.objects.create(
+                time=time,
+                user=user,
+                action=action,
+                is_pleasant=True,
+                duration=60,
+                **kwargs,
+            )
+
+    def test_send_reminders_coalesces_habits_per_user(self):
+        user = User.objects.create(email="email", tg_chat_id="tg_chat_id")
+        for action in ("Drink water", "Stretch"):
+            self.create_habit("10:00", user, action)
+
+        with patch("habits.tasks.timezone.now", return_value=self.at(10, 0)):
+            self.send_reminders()
+
+        self.send_mock.assert_called_once_with(
+            [("tg_chat_id", "Time for your habits:\n10:00 Drink water\n10:00 Stretch")]
+        )
+
+    def test_send_reminders_digest_window(self):
+        user = User.objects.create(
+            email="email", tg_chat_id="tg_chat_id", digest_window=60
+        )
+        for time, action in (("10:00", "Drink water"), ("10:45", "Stretch")):
+            self.create_habit(time, user, action)
+
+        with patch("habits.tasks.timezone.now", return_value=self.at(10, 0)):
+            self.send_reminders()
+        self.send_mock.assert_called_once_with(
+            [("tg_chat_id", "Time for your habits:\n10:00 Drink water\n10:45 Stretch")]
+        )
+
+        self.send_mock.reset_mock()
+        with patch("habits.tasks.timezone.now", return_value=self.at(10, 45)):
+            self.send_reminders()
+        self.send_mock.assert_not_called()
+
+    @override_settings(REMINDER_MAX_CATCHUP=60)
+    def test_send_reminders_catches_up_on_missed_reminders(self):
+        for index, time in enumerate(("08:00", "09:30")):
+            user = User.objects.create(email=f"{index}@sky.pro", tg_chat_id=index)
+            self.create_habit(time, user, time)
+
+        with patch("habits.tasks.timezone.now", return_value=self.at(10, 0)):
+            self.send_reminders()
+
+        # The 08:00 reminder is too late to be worth sending.
+        self.send_mock.assert_called_once_with([("1", "Time for your habit: 09:30")])
+        self.assertEqual(
+            sorted(Habit.objects.values_list("next_fire_at", flat=True)),
+            [
+                self.at(8, 0) + datetime.timedelta(days=1),
+                self.at(9, 30) + datetime.timedelta(days=1),
+            ],
+        )
+
+    def test_send_reminders_follows_periodicity(self):
+        user = User.objects.create(email="email", tg_chat_id="tg_chat_id")
+        habit = self.create_habit("10:00", user, periodicity=3)
+
+        with patch("habits.tasks.timezone.now", return_value=self.at(10, 0)):
+            self.send_reminders()
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, self.at(10, 0) + datetime.timedelta(3))
+
+        # A run missing the due date keeps to the original cadence.
+        late = self.at(11, 0) + datetime.timedelta(days=4)
+        with patch("habits.tasks.timezone.now", return_value=late):
+            self.send_reminders()
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, self.at(10, 0) + datetime.timedelta(6))
+
+    def test_next_fire_at_is_computed_in_users_timezone(self):
+        user = User.objects.create(email="email", timezone="Europe/Moscow")
+        habit = self.create_habit("12:00", user)
+        self.assertEqual(habit.next_fire_at, self.at(9, 0))
+
+        user.timezone = "Asia/Kathmandu"
+        with patch("habits.models.timezone.now", return_value=self.at(0, 0)):
+            user.save()
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, self.at(6, 15))
+
+    def test_timezone_change_reschedules_to_the_next_occurrence(self):
+        user = User.objects.create(email="email")
+        habit = self.create_habit("23:00", user)
+        self.assertEqual(habit.next_fire_at, self.at(23, 0))
+
+        # 23:00 in Tokyo on the same local date has passed by 22:00 UTC.
+        user.timezone = "Asia/Tokyo"
+        with patch("habits.models.timezone.now", return_value=self.at(22, 0)), patch(
+            "habits.signals.schedule_reminders"
+        ) as schedule_reminders:
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+        habit.refresh_from_db()
+        self.assertEqual(
+            habit.next_fire_at, self.at(14, 0) + datetime.timedelta(days=1)
+        )
+        schedule_reminders.assert_called_once_with(habit.next_fire_at)
+
+    def test_saving_user_keeps_next_fire_at(self):
+        user = User.objects.create(email="email")
+        habit = self.create_habit("08:00", user, periodicity=3)
+        Habit.objects.update(next_fire_at=self.at(8, 0) + datetime.timedelta(days=2))
+
+        user = User.objects.get(pk=user.pk)
+        user.city = "Tver"
+        with patch("habits.models.timezone.now", return_value=self.at(9, 0)):
+            user.save()
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, self.at(8, 0) + datetime.timedelta(days=2))
+
+    def test_timezone_change_keeps_due_reminder_due(self):
+        user = User.objects.create(email="email")
+        habit = self.create_habit("08:00", user, periodicity=3)
+
+        user.timezone = "Europe/Moscow"
+        with patch("habits.models.timezone.now", return_value=self.at(8, 30)):
+            user.save()
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, self.at(5, 0))
+
+    def test_next_fire_at_follows_time(self):
+        user = User.objects.create(email="email")
+        habit = self.create_habit("09:30", user)
+        self.assertEqual(habit.next_fire_at, self.at(9, 30))
+
+        habit.time = datetime.time(hour=23, minute=59)
+        with patch("habits.models.timezone.now", return_value=self.at(0, 0)):
+            habit.save(update_fields=["time"])
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, self.at(23, 59))
+
+    def test_refresh_utc_offsets_follows_dst(self):
+        user = User.objects.create(email="email", timezone="America/New_York")
+        habit = Habit.objects.create(
+            time="08:00", user=user, action="action", is_pleasant=True, duration=60
+        )
+        # Pretend the reminder was scheduled on the other side of a DST switch.
+        User.objects.update(utc_offset=user.utc_offset + 60)
+        Habit.objects.update(
+            next_fire_at=F("next_fire_at") - datetime.timedelta(hours=1)
+        )
+
+        refresh_utc_offsets()
+
+        user.refresh_from_db()
+        self.assertEqual(user.utc_offset, get_utc_offset(user.timezone))
+        self.assertEqual(Habit.objects.get().next_fire_at, habit.next_fire_at)
 
-            send_telegram_message_mock.assert_called_once_with(
-                chat_id="tg_chat_id",
-                message="Time for your habit: action",
+    def test_schedule_reminders_keeps_the_earliest_run(self):
+        cache.delete(NEXT_RUN_KEY)
+        self.addCleanup(cache.delete, NEXT_RUN_KEY)
+        now = timezone.now()
+        with patch("habits.tasks.send_reminders.apply_async") as apply_async:
+            schedule_reminders(now + datetime.timedelta(minutes=5))
+            schedule_reminders(now + datetime.timedelta(minutes=10))
+            apply_async.assert_called_once_with(eta=now + datetime.timedelta(minutes=5))
+
+            # A far-off reminder still gets a run within REMINDER_INTERVAL.
+            cache.delete(NEXT_RUN_KEY)
+            apply_async.reset_mock()
+            with override_settings(REMINDER_INTERVAL=15):
+                schedule_reminders(now + datetime.timedelta(days=1))
+            self.assertLessEqual(
+                apply_async.call_args.kwargs["eta"],
+                timezone.now() + datetime.timedelta(minutes=15),
             )
+
+    def create_notification(self, **kwargs):
+        user = User.objects.create(email=f"{Notification.objects.count()}@sky.pro")
+        return Notification.objects.create(
+            user=user, chat_id="tg_chat_id", text="text", **kwargs
+        )
+
+    def test_dispatch_notifications_retries_with_backoff(self):
+        notification = self.create_notification()
+        self.send_mock.side_effect = lambda messages: [
+            TelegramError("Bot API responded with 502", status_code=502)
+        ]
+
+        dispatch_notifications()
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.PENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+        # A permanent error is not retried.
+        Notification.objects.update(next_attempt_at=timezone.now())
+        self.send_mock.side_effect = lambda messages: [
+            TelegramError("Bot API responded with 403", status_code=403)
+        ]
+        dispatch_notifications()
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.FAILED)
+        self.assertEqual(notification.attempts, 2)
+
+    def test_dispatch_notifications_takes_over_expired_leases(self):
+        expired = self.create_notification(
+            status=Notification.SENDING,
+            next_attempt_at=timezone.now() - datetime.timedelta(seconds=1),
+        )
+        leased = self.create_notification(
+            status=Notification.SENDING,
+            next_attempt_at=timezone.now() + datetime.timedelta(minutes=1),
+        )
+
+        dispatch_notifications()
+
+        self.assertEqual(
+            Notification.objects.get(pk=expired.pk).status, Notification.SENT
+        )
+        self.assertEqual(
+            Notification.objects.get(pk=leased.pk).status, Notification.SENDING
+        )
+
+    def test_dispatch_stops_while_circuit_is_open(self):
+        circuit = CircuitBreaker("test", threshold=2, reset_timeout=60)
+        self.addCleanup(circuit.record_success)
+        self.send_mock.side_effect = lambda messages: [
+            TelegramError("Read timed out.") for _ in messages
+        ]
+        for _ in range(3):
+            self.create_notification()
+
+        with override_settings(NOTIFICATION_BATCH_SIZE=1), patch(
+            "habits.tasks.telegram_circuit", circuit
+        ):
+            dispatch_notifications()
+
+        self.assertTrue(circuit.is_open())
+        self.assertEqual(self.send_mock.call_count, 2)
+
+    @staticmethod
+    def at(hour, minute):
+        return datetime.datetime(2024, 9, 2, hour, minute, tzinfo=datetime.timezone.utc)
+
+    def test_split_into_shards_keeps_users_together(self):
+        self.assertEqual(
+            split_into_shards([1, 1, 2, 3, 3, 3, 4], shard_size=2),
+            [(1, 1), (2, 3), (4, 4)],
+        )
+        self.assertEqual(split_into_shards([], shard_size=2), [])
+
+
+class BenchRemindersTestCase(TestCase):
+    def test_bench_reminders_writes_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "results.json"
+            call_command(
+                "bench_reminders",
+                "--users=3",
+                "--habits=6",
+                "--latency=0",
+                f"--output={output}",
+                stdout=StringIO(),
+            )
+            results = json.loads(output.read_text())
+
+        self.assertEqual(results["messages"], 3)
+        self.assertEqual(results["sent"], 3)
+        self.assertEqual(results["bot_api"]["requests"], 3)
+        self.assertGreater(results["db_queries"], 0)
+        self.assertFalse(User.objects.exists())
+
+    def test_bench_reminders_refuses_to_touch_real_reminders(self):
+        user = User.objects.create(email="test@sky.pro", tg_chat_id="tg_chat_id")
+        notification = Notification.objects.create(
+            user=user, chat_id="tg_chat_id", text="text"
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("bench_reminders", "--users=1", stdout=StringIO())
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.PENDING)
+        self.assertEqual(User.objects.count(), 1)
+
+
+class BenchSerializersTestCase(TestCase):
+    def test_bench_serializers_reports_speedup(self):
+        stdout = StringIO()
+        call_command(
+            "bench_serializers", "--sizes", "1", "5", "--repeat=1", stdout=stdout
+        )
+
+        results = json.loads(stdout.getvalue())
+        self.assertEqual([result["page_size"] for result in results], [1, 5])
+        self.assertGreater(results[0]["speedup"], 0)
+
+
+class BenchConcurrencyTestCase(TestCase):
+    def test_bench_concurrency_loads_both_servers(self):
+        User.objects.create(email="bench@sky.pro")
+        seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                seen.append((self.path, self.headers["Authorization"]))
+                self.send_response(200 if self.path == "/habits/" else 503)
+                self.end_headers()
+                self.wfile.write(b"[]")
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        stdout = StringIO()
+        call_command(
+            "bench_concurrency",
+            f"--wsgi-url={base_url}/habits/",
+            f"--asgi-url={base_url}/habits/async/",
+            "--concurrency",
+            "1",
+            "3",
+            "--requests=6",
+            stdout=stdout,
+        )
+
+        results = json.loads(stdout.getvalue())
+        self.assertEqual([level["concurrency"] for level in results["wsgi"]], [1, 3])
+        self.assertEqual(results["wsgi"][1]["errors"], 0)
+        self.assertGreater(results["wsgi"][1]["requests_per_second"], 0)
+        self.assertEqual(results["asgi"][0]["errors"], 6)
+        self.assertEqual(len(seen), 24)
+        self.assertTrue(seen[0][1].startswith("Bearer "))
+
+
+class ConnectionMetricsTestCase(APITestCase):
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram(buckets=(0.01, 0.1))
+        for value in [0.005, 0.05, 0.07, 3]:
+            histogram.observe(value)
+
+        self.assertEqual(
+            histogram.snapshot(),
+            {
+                "buckets": {"0.01": 1, "0.1": 3, "+Inf": 4},
+                "count": 4,
+                "sum": 3.125,
+            },
+        )
+
+    def test_metered_connections_are_counted(self):
+        wrapper_class = type(
+            "DatabaseWrapper",
+            (MeteredDatabaseWrapperMixin, sqlite3_base.DatabaseWrapper),
+            {},
+        )
+        # In-memory SQLite databases ignore close().
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = wrapper_class(
+            {**connection.settings_dict, "NAME": f"{directory.name}/metered.db"},
+            alias="metered",
+        )
+
+        wrapper.ensure_connection()
+        wrapper.ensure_connection()
+        wrapper.close()
+
+        stats = connection_stats.snapshot()["metered"]
+        self.assertEqual((stats["opened"], stats["closed"], stats["open"]), (1, 1, 0))
+        self.assertEqual(stats["connect_seconds"]["count"], 1)
+
+    def test_db_metrics_are_documented(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        self.assertIn("get", schema["paths"]["/metrics/db/"])
+
+    def test_db_metrics_are_for_admins(self):
+        user = User.objects.create(email="test@sky.pro")
+        self.client.force_authenticate(user=user)
+        url = reverse("db-metrics")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data["server"])
+
+
+class RequestMetricsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="test@sky.pro")
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+
+    def test_server_timing_counts_queries(self):
+        for name in ["habits:habit-list", "habits:habit-list-async"]:
+            response = self.client.get(reverse(name), {"is_public": "false"})
+            self.assertRegex(
+                response["Server-Timing"],
+                r'^db;dur=[\d.]+;desc="1 queries", serialize;dur=[\d.]+, '
+                r"total;dur=[\d.]+$",
+            )
+
+    async def test_server_timing_under_asgi(self):
+        token = AccessToken.for_user(self.user)
+        response = await self.async_client.get(
+            reverse("habits:habit-list-async"),
+            {"is_public": "false"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The user lookup and the habits
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+    def test_slow_requests_are_logged(self):
+        with override_settings(SLOW_REQUEST_THRESHOLD=-1), self.assertLogs(
+            "config.middleware", "WARNING"
+        ) as logs:
+            self.client.get(reverse("habits:habit-list"))
+
+        self.assertIn(
+            "Slow request GET /habits/habits/ (habits:habit-list)", logs.output[0]
+        )
+
+    def test_metrics_are_exposed_to_scrapers(self):
+        self.client.get(reverse("habits:habit-list"))
+        url = reverse("metrics")
+
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{view="habits:habit-list",'
+            f'method="GET",process="{get_process_name()}",le="+Inf"}}',
+            response.content.decode(),
+        )
+        self.assertIn(
+            "# TYPE http_request_db_queries histogram", response.content.decode()
+        )
@@ -7,5 +7,22 @@ app_name = HabitsConfig.name
 
 urlpatterns = [
     path("habits/", views.HabitList.as_view(), name="habit-list"),
+    path("habits/async/", views.AsyncHabitList.as_view(), name="habit-list-async"),
+    path("habits/batch/", views.HabitBatch.as_view(), name="habit-batch"),
     path("habits/<int:pk>/", views.HabitDetail.as_view(), name="habit-detail"),
+    path(
+        "habits/<int:pk>/async/",
+        views.AsyncHabitDetail.as_view(),
+        name="habit-detail-async",
+    ),
+    path(
+        "habits/<int:pk>/complete/",
+        views.HabitComplete.as_view(),
+        name="habit-complete",
+    ),
+    path(
+        "habits/<int:pk>/stats/",
+        views.HabitStatsDetail.as_view(),
+        name="habit-stats",
+    ),
 ]
@@ -26,7 +26,7 @@ def validate_pleasant_habit(data):
 
 def validate_habit_periodicity(data):
     periodicity = data.get("periodicity")
-    if periodicity < 1 or periodicity > 7:
+    if periodicity is not None and (periodicity < 1 or periodicity > 7):
         raise ValidationError(
             "Habit can not be performed less than once "
             "per 7 days or more than once per day."
@@ -1,11 +1,133 @@
+import heapq
+from bisect import bisect_right
+from itertools import islice, zip_longest
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-from habits.models import Habit
+from config.serializers import defer_unrequested, get_requested_fields
+from config.views import AsyncListAPIView, AsyncRetrieveAPIView
+from habits.caching import (PUBLIC_HABITS_KEY, AsyncConditionalGetMixin,
+                            ConditionalGetMixin, bump_versions, get_habit_key,
+                            get_habit_version_keys, get_public_feed,
+                            get_user_habits_key)
+from habits.filters import HabitFilter
+from habits.models import Habit, HabitCompletion, HabitStats
 from habits.paginations import CustomPagination
 from habits.permissions import IsOwnerOrReadOnly
-from habits.serializers import HabitSerializer
+from habits.serializers import (HABIT_COLUMN_BY_FIELD, HABIT_FIELDS,
+                                HabitBatchSerializer,
+                                HabitCompletionSerializer, HabitSerializer,
+                                HabitStatsSerializer, serialize_habit,
+                                serialize_habits)
+from habits.services import get_completion_buffer
+from habits.tasks import (flush_completions, record_completions,
+                          schedule_reminders)
+
+
+class MergedHabits:
+    """A user's habit list as a sequence for the paginator.
+
+    Pages within the cached head of the public feed are merged from it and
+    the user's own private habits; pages reaching past it are read from
+    `rows`, the `visible_to()` query.
+    """
+
+    def __init__(self, feed, own_habits, rows, fields):
+        self.public_habits = feed["habits"]
+        self.public_count = feed["count"]
+        self.own_habits = own_habits
+        self.rows = rows
+        self.fields = fields
+
+    def __len__(self):
+        return self.public_count + len(self.own_habits)
+
+    def get_merged_length(self):
+        """Returns how many habits from the start of the list the head
+        determines."""
+        if len(self.public_habits) == self.public_count:
+            return len(self)
+        if not self.public_habits:
+            return 0
+        # Own habits after the head may come after public habits beyond it.
+        last_id = self.public_habits[-1]["id"]
+        return len(self.public_habits) + bisect_right(
+            [habit["id"] for habit in self.own_habits], last_id
+        )
+
+    def __getitem__(self, index):
+        if index.stop > self.get_merged_length():
+            return [serialize_habit(row, self.fields) for row in self.rows[index]]
+        habits = heapq.merge(self.public_habits, self.own_habits, key=itemgetter("id"))
+        page = islice(habits, index.start, index.stop)
+        if self.fields != HABIT_FIELDS:
+            page = ({field: habit[field] for field in self.fields} for habit in page)
+        return list(page)
+
+
+class HabitListMixin:
+    """What the sync and async habit lists share."""
+
+    permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = HabitFilter
+
+    def get_version_keys(self):
+        return [get_user_habits_key(self.request.user.pk), PUBLIC_HABITS_KEY]
+
+    def get_queryset(self):
+        return Habit.objects.visible_to(self.request.user)
+
+    def reads_database(self, request):
+        """Whether the page is queried directly rather than merged from the
+        public feed and the user's own private habits.
+
+        Without a shared cache the feed of one process would miss changes
+        made through another.
+        """
+        return (
+            not settings.SHARED_CACHE
+            or self.paginator.use_cursor(request)
+            or HabitFilter.is_filtering(request)
+        )
+
+    def get_rows(self, fields):
+        columns = {"id", *(HABIT_COLUMN_BY_FIELD[field] for field in fields)}
+        return self.filter_queryset(self.get_queryset()).values(*columns)
+
+    def get_own_habits(self):
+        return Habit.objects.filter(user=self.request.user, is_public=False).order_by(
+            "id"
+        )
+
+    def get_merged_response(self, public_feed, own_habits, fields):
+        page = self.paginate_queryset(
+            MergedHabits(public_feed, own_habits, self.get_rows(fields), fields)
+        )
+        return self.get_paginated_response(page)
+
+    def build_public_feed(self):
+        """Returns the first PUBLIC_FEED_SIZE public habits and the count of
+        all of them."""
+        public_habits = Habit.objects.filter(is_public=True).order_by("id")
+        habits = serialize_habits(public_habits[: settings.PUBLIC_FEED_SIZE])
+        if len(habits) < settings.PUBLIC_FEED_SIZE:
+            count = len(habits)
+        else:
+            count = public_habits.count()
+        return {"habits": habits, "count": count}
 
 
 @extend_schema(
@@ -20,38 +142,86 @@ from habits.serializers import HabitSerializer
     description="Creates a new Habit owned by the current user.",
     tags=["Habits"],
 )
-class HabitList(generics.ListCreateAPIView):
+class HabitList(HabitListMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     queryset = Habit.objects.all()
     serializer_class = HabitSerializer
-    permission_classes = [IsAuthenticated]
-    pagination_class = CustomPagination
 
-    def get_queryset(self):
-        user_habits = Habit.objects.filter(user=self.request.user)
-
-        public_habits = Habit.objects.filter(is_public=True)
+    def list(self, request, *args, **kwargs):
+        # Rows are read with .values() and rendered without HabitSerializer,
+        # which is only needed to validate writes. Pages are ordered by id,
+        # so it is read even when not requested.
+        fields = get_requested_fields(request, HABIT_FIELDS)
+        if self.reads_database(request):
+            page = self.paginate_queryset(self.get_rows(fields))
+            return self.get_paginated_response(
+                [serialize_habit(row, fields) for row in page]
+            )
 
-        return user_habits | public_habits
+        # Unfiltered, the public habits come from the shared feed; only the
+        # user's own private habits are queried.
+        return self.get_merged_response(
+            get_public_feed(self.build_public_feed),
+            serialize_habits(self.get_own_habits(), ["id", *fields]),
+            fields,
+        )
 
     def perform_create(self, serializer):
         if self.request.user.is_authenticated:
             serializer.save(user=self.request.user)
 
 
-@extend_schema(tags=["Habits"])
-class HabitDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Habit.objects.all()
+@extend_schema(
+    summary="Get the list of Habits and public Habits (async)",
+    description="HabitList for ASGI servers, reading through the async ORM.",
+    tags=["Habits"],
+)
+class AsyncHabitList(HabitListMixin, AsyncConditionalGetMixin, AsyncListAPIView):
+    serializer_class = HabitSerializer
+
+    async def list(self, request, *args, **kwargs):
+        fields = get_requested_fields(request, HABIT_FIELDS)
+        if self.reads_database(request):
+            # The paginators evaluate the page themselves.
+            page = await sync_to_async(self.paginate_queryset)(self.get_rows(fields))
+            return self.get_paginated_response(
+                [serialize_habit(row, fields) for row in page]
+            )
+
+        columns = [HABIT_COLUMN_BY_FIELD[field] for field in ["id", *fields]]
+        own_habits = [
+            serialize_habit(row, ["id", *fields])
+            async for row in self.get_own_habits().values(*columns)
+        ]
+        public_feed = await sync_to_async(get_public_feed)(self.build_public_feed)
+        # Pages past the head of the feed are queried.
+        return await sync_to_async(self.get_merged_response)(
+            public_feed, own_habits, fields
+        )
+
+
+class HabitDetailMixin:
+    """What the sync and async habit details share."""
+
     serializer_class = HabitSerializer
     permission_classes = [IsOwnerOrReadOnly]
 
+    def get_version_keys(self):
+        return [get_habit_key(self.kwargs["pk"])]
+
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            user_habits = Habit.objects.filter(user=self.request.user)
-        else:
-            user_habits = Habit.objects.none()
+        return defer_unrequested(
+            Habit.objects.visible_to(self.request.user),
+            self.request,
+            HABIT_FIELDS,
+            required=["id", "user", "is_public"],
+        )
 
-        public_habits = Habit.objects.filter(is_public=True)
-        return user_habits | public_habits
+
+@extend_schema(tags=["Habits"])
+class HabitDetail(
+    HabitDetailMixin, ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView
+):
+    queryset = Habit.objects.all()
 
     @extend_schema(
         summary="Get the details of a Habit",
@@ -60,6 +230,10 @@ class HabitDetail(generics.RetrieveUpdateDestroyAPIView):
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
+    def retrieve(self, request, *args, **kwargs):
+        fields = get_requested_fields(request, HABIT_FIELDS)
+        return Response(serialize_habit(vars(self.get_object()), fields))
+
     @extend_schema(
         summary="Update a Habit",
         description="Updates the details of a particular Habit.",
@@ -80,3 +254,301 @@ class HabitDetail(generics.RetrieveUpdateDestroyAPIView):
     )
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
+
+
+@extend_schema(
+    summary="Get the details of a Habit (async)",
+    description="HabitDetail for ASGI servers, reading through the async ORM.",
+    tags=["Habits"],
+)
+class AsyncHabitDetail(
+    HabitDetailMixin, AsyncConditionalGetMixin, AsyncRetrieveAPIView
+):
+    async def retrieve(self, request, *args, **kwargs):
+        habit = await aget_object_or_404(self.get_queryset(), pk=self.kwargs["pk"])
+        self.check_object_permissions(request, habit)
+        fields = get_requested_fields(request, HABIT_FIELDS)
+        return Response(serialize_habit(vars(habit), fields))
+
+
+class HabitBatch(generics.GenericAPIView):
+    """Creates, updates, deletes and retrieves many habits per request.
+
+    Writes validate the whole batch first and are applied all together in
+    one transaction, or not at all; errors name the failing items by their
+    position in the batch.
+    """
+
+    serializer_class = HabitBatchSerializer
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 100
+
+    def get_queryset(self):
+        return Habit.objects.filter(user=self.request.user)
+
+    def get_items(self):
+        items = self.request.data
+        if not isinstance(items, list) or not all(
+            isinstance(item, dict) for item in items
+        ):
+            raise ValidationError({"non_field_errors": ["Expected a list of objects."]})
+        if len(items) > self.max_batch_size:
+            raise ValidationError(
+                {
+                    "non_field_errors": [
+                        f"A batch holds at most {self.max_batch_size} items."
+                    ]
+                }
+            )
+        return items
+
+    def get_batch_serializer(self, items):
+        # Resolve every related habit of the batch in a single query.
+        related_ids = {
+            int(item["related_habit"])
+            for item in items
+            if str(item.get("related_habit")).isdigit()
+        }
+        context = self.get_serializer_context()
+        context["related_habits"] = Habit.objects.in_bulk(related_ids)
+        return self.get_serializer(data=items, many=True, context=context)
+
+    def get_ids(self):
+        ids = self.request.query_params.get("ids", "").split(",")
+        if self.request.method == "DELETE":
+            ids = (
+                self.request.data.get("ids")
+                if isinstance(self.request.data, dict)
+                else None
+            )
+            if not isinstance(ids, list):
+                raise ValidationError({"ids": ["Expected a list of habit ids."]})
+        try:
+            ids = [int(pk) for pk in ids if pk != ""]
+        except (TypeError, ValueError):
+            raise ValidationError({"ids": ["Expected a list of habit ids."]})
+        if len(ids) > self.max_batch_size:
+            raise ValidationError(
+                {"ids": [f"A batch holds at most {self.max_batch_size} items."]}
+            )
+        return ids
+
+    @staticmethod
+    def is_id(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def get_error_response(self, errors, ids=None):
+        """Returns a 400 response naming every failing item, if any."""
+        failed = [
+            {"index": index, **({"id": ids[index]} if ids else {}), "errors": error}
+            for index, error in enumerate(errors)
+            if error
+        ]
+        if failed:
+            return Response({"errors": failed}, status=status.HTTP_400_BAD_REQUEST)
+
+    def publish_changes(self, habits, was_public=()):
+        """Once committed, invalidates cached versions and schedules reminders
+        for habits that bypassed the model signals."""
+        keys = set()
+        for habit, public in zip_longest(habits, was_public, fillvalue=False):
+            keys.update(get_habit_version_keys(habit, was_public=public))
+        fire_times = [habit.next_fire_at for habit in habits if habit.next_fire_at]
+        transaction.on_commit(lambda: bump_versions(list(keys)), robust=True)
+        if fire_times:
+            transaction.on_commit(
+                lambda: schedule_reminders(min(fire_times)), robust=True
+            )
+
+    @extend_schema(
+        summary="Get many Habits",
+        description=(
+            "Retrieves the user's or public Habits with the ids given as "
+            "`?ids=1,2,3`, and lists the ids that were not found."
+        ),
+        tags=["Habits"],
+    )
+    def get(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        habits = serialize_habits(
+            Habit.objects.visible_to(request.user).filter(pk__in=ids)
+        )
+        found = {habit["id"] for habit in habits}
+        return Response(
+            {
+                "results": habits,
+                "not_found": [pk for pk in ids if pk not in found],
+            }
+        )
+
+    @extend_schema(
+        summary="Create many Habits",
+        description="Creates a list of new Habits owned by the current user.",
+        tags=["Habits"],
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_batch_serializer(self.get_items())
+        if not serializer.is_valid():
+            return self.get_error_response(serializer.errors)
+
+        habits = [
+            Habit(user=request.user, **data) for data in serializer.validated_data
+        ]
+        for habit in habits:
+            habit.update_schedule()
+        with transaction.atomic():
+            Habit.objects.bulk_create(habits)
+            self.publish_changes(habits)
+        return Response(
+            [serialize_habit(vars(habit)) for habit in habits],
+            status=status.HTTP_201_CREATED,
+        )
+
+    @extend_schema(
+        summary="Update many Habits",
+        description=(
+            "Partially updates a list of the user's Habits, each identified by "
+            "its `id`."
+        ),
+        tags=["Habits"],
+    )
+    def patch(self, request, *args, **kwargs):
+        items = self.get_items()
+        ids = [item.get("id") for item in items]
+        with transaction.atomic():
+            habits = (
+                self.get_queryset()
+                .select_for_update()
+                .in_bulk([pk for pk in ids if self.is_id(pk)])
+            )
+            errors, merged = [], []
+            for index, (pk, item) in enumerate(zip(ids, items)):
+                if not self.is_id(pk):
+                    errors.append({"id": ["Expected a habit id."]})
+                    continue
+                habit = habits.get(pk)
+                if habit is None:
+                    errors.append({"id": ["Habit not found."]})
+                    continue
+                if pk in ids[:index]:
+                    errors.append({"id": ["Habit is listed more than once."]})
+                    continue
+                errors.append({})
+                # Validate the habit as it will be after the update.
+                merged.append({**serialize_habit(vars(habit)), **item})
+            if response := self.get_error_response(errors, ids):
+                return response
+
+            serializer = self.get_batch_serializer(merged)
+            if not serializer.is_valid():
+                return self.get_error_response(serializer.errors, ids)
+
+            was_public = [habits[pk].is_public for pk in ids]
+            for pk, data in zip(ids, serializer.validated_data):
+                habit = habits[pk]
+                habit.user = request.user
+                for field, value in data.items():
+                    setattr(habit, field, value)
+                habit.update_schedule()
+            updated = [habits[pk] for pk in ids]
+            Habit.objects.bulk_update(
+                updated,
+                [
+                    field
+                    for field in HABIT_FIELDS
+                    if field not in HabitBatchSerializer.Meta.read_only_fields
+                ]
+                + ["next_fire_at"],
+            )
+            self.publish_changes(updated, was_public)
+        return Response([serialize_habit(vars(habit)) for habit in updated])
+
+    @extend_schema(
+        summary="Delete many Habits",
+        description="Deletes the user's Habits whose ids are given as `ids`.",
+        tags=["Habits"],
+    )
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        with transaction.atomic():
+            habits = self.get_queryset().in_bulk(ids)
+            if response := self.get_error_response(
+                [{} if pk in habits else {"id": ["Habit not found."]} for pk in ids],
+                ids,
+            ):
+                return response
+            self.get_queryset().filter(pk__in=ids).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema(
+    summary="Mark a Habit as done",
+    description=(
+        "Records that the current user performed their Habit, now or at "
+        "`completed_at`. Responds with 202 while the completion waits in the "
+        "write buffer."
+    ),
+    tags=["Habits"],
+)
+class HabitComplete(generics.CreateAPIView):
+    serializer_class = HabitCompletionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Habit.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        habit = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        completed_at = serializer.validated_data.get("completed_at", timezone.now())
+        completion = HabitCompletion(
+            habit=habit,
+            completed_at=completed_at,
+            completed_on=completed_at.astimezone(request.user.timezone).date(),
+        )
+        # Streaks are counted forward from the last completion.
+        last_done = (
+            HabitStats.objects.filter(habit=habit)
+            .values_list("last_done", flat=True)
+            .first()
+        )
+        if last_done is not None and completion.completed_on < last_done:
+            raise ValidationError(
+                {"completed_at": ["A habit cannot be done before its last completion."]}
+            )
+
+        buffer = get_completion_buffer()
+        if buffer is None:
+            record_completions([completion])
+            status_code = status.HTTP_201_CREATED
+        else:
+            # Flush as soon as a full batch is waiting.
+            if (
+                buffer.push(completion.to_payload()) % settings.COMPLETION_BATCH_SIZE
+                == 0
+            ):
+                flush_completions.delay()
+            status_code = status.HTTP_202_ACCEPTED
+        return Response(self.get_serializer(completion).data, status=status_code)
+
+
+@extend_schema(
+    summary="Get the streaks of a Habit",
+    description="Retrieves the current and best streak of a user's or public Habit.",
+    tags=["Habits"],
+)
+class HabitStatsDetail(generics.RetrieveAPIView):
+    serializer_class = HabitStatsSerializer
+
+    def get_queryset(self):
+        return Habit.objects.visible_to(self.request.user)
+
+    def get_object(self):
+        habit = get_object_or_404(
+            self.get_queryset().select_related("user", "stats"), pk=self.kwargs["pk"]
+        )
+        try:
+            return habit.stats
+        except HabitStats.DoesNotExist:
+            return HabitStats(habit=habit)
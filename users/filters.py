@@ -0,0 +1,11 @@
+from django_filters import rest_framework as filters
+
+from users.models import User
+
+
+class UserFilter(filters.FilterSet):
+    email_prefix = filters.CharFilter(field_name="email", lookup_expr="startswith")
+
+    class Meta:
+        model = User
+        fields = ["city"]
@@ -0,0 +1,127 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+
+from users.models import User, get_utc_offset
+
+FIELDS = (
+    "email",
+    "password",
+    "first_name",
+    "last_name",
+    "phone",
+    "city",
+    "tg_chat_id",
+    "timezone",
+)
+
+
+def read_rows(file, file_format):
+    if file_format == "csv":
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_user(row, password):
+    unknown = set(row) - set(FIELDS)
+    if unknown:
+        raise CommandError(f"Unknown columns: {', '.join(sorted(unknown))}")
+    if not row.get("email"):
+        raise CommandError(f"Row without an email: {row}")
+    try:
+        user = User(
+            email=User.objects.normalize_email(row["email"]),
+            password=password,
+            first_name=row.get("first_name") or "",
+            last_name=row.get("last_name") or "",
+            phone=row.get("phone") or None,
+            city=row.get("city") or None,
+            tg_chat_id=row.get("tg_chat_id") or None,
+            timezone=row.get("timezone") or "UTC",
+            is_active=True,
+        )
+    except ValidationError as error:
+        raise CommandError(f"Invalid row for {row['email']}: {'; '.join(error)}")
+    # bulk_create() skips User.save(), which keeps utc_offset in sync.
+    user.utc_offset = get_utc_offset(user.timezone)
+    return user
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users in bulk from a CSV or NDJSON file. Plain-text passwords "
+        "are hashed across a pool of processes. Users whose email already "
+        "exists are left untouched, so an interrupted import can be rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", help=f"File with the columns {', '.join(FIELDS)}; - for stdin."
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="Defaults to ndjson for .ndjson and .jsonl files, else csv.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Users per INSERT."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Password hashing processes; 1 hashes in this process.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+        )
+        workers = options["workers"]
+        file = sys.stdin if path == "-" else open(path, newline="")
+        executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        try:
+            self.import_users(
+                read_rows(file, file_format), options["batch_size"], executor, workers
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if file is not sys.stdin:
+                file.close()
+
+    def import_users(self, rows, batch_size, executor, workers):
+        started = time.perf_counter()
+        total = 0
+        while batch := list(islice(rows, batch_size)):
+            passwords = [row.get("password") or None for row in batch]
+            if executor is None:
+                hashed = map(make_password, passwords)
+            else:
+                hashed = executor.map(
+                    make_password,
+                    passwords,
+                    chunksize=max(1, len(passwords) // (workers * 4)),
+                )
+            User.objects.bulk_create(
+                [build_user(row, password) for row, password in zip(batch, hashed)],
+                ignore_conflicts=True,
+            )
+            total += len(batch)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{total} users in {elapsed:.1f}s ({total / elapsed:.0f} users/s)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Read {total} users."))
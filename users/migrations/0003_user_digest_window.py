@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_alter_user_options_user_tg_chat_id_alter_user_avatar_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="digest_window",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                choices=[
+                    (15, "15 minutes"),
+                    (30, "30 minutes"),
+                    (60, "1 hour"),
+                    (120, "2 hours"),
+                    (180, "3 hours"),
+                    (240, "4 hours"),
+                ],
+                help_text="Send one reminder for all habits due within this many minutes.",
+                null=True,
+                verbose_name="reminder digest window",
+            ),
+        ),
+    ]
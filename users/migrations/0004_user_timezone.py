@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 11:55
+
+import timezone_field.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_user_digest_window"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="timezone",
+            field=timezone_field.fields.TimeZoneField(
+                db_index=True, default="UTC", verbose_name="timezone"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="utc_offset",
+            field=models.SmallIntegerField(
+                default=0, editable=False, verbose_name="current UTC offset in minutes"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0004_user_timezone"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["city", "email"], name="user_city_email"),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["email"],
+                name="user_email_prefix",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
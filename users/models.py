@@ -1,8 +1,20 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
+from timezone_field import TimeZoneField
 
 NULLABLE = {"blank": True, "null": True}
 
+# Digest windows in minutes; each divides a day so windows line up at midnight.
+DIGEST_WINDOW_CHOICES = [
+    (15, "15 minutes"),
+    (30, "30 minutes"),
+    (60, "1 hour"),
+    (120, "2 hours"),
+    (180, "3 hours"),
+    (240, "4 hours"),
+]
+
 
 class User(AbstractUser):
     username = None
@@ -15,6 +27,16 @@ class User(AbstractUser):
     tg_chat_id = models.CharField(
         max_length=50, verbose_name="telegram chat-id", **NULLABLE
     )
+    digest_window = models.PositiveSmallIntegerField(
+        choices=DIGEST_WINDOW_CHOICES,
+        verbose_name="reminder digest window",
+        help_text="Send one reminder for all habits due within this many minutes.",
+        **NULLABLE,
+    )
+    timezone = TimeZoneField(default="UTC", db_index=True, verbose_name="timezone")
+    utc_offset = models.SmallIntegerField(
+        default=0, editable=False, verbose_name="current UTC offset in minutes"
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -23,6 +45,42 @@ class User(AbstractUser):
         verbose_name = "user"
         verbose_name_plural = "users"
         ordering = ["email"]
+        indexes = [
+            # Serve the user list filtered by city, or by an email prefix,
+            # in email order.
+            models.Index(fields=["city", "email"], name="user_city_email"),
+            models.Index(
+                fields=["email"],
+                name="user_email_prefix",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
 
     def __str__(self):
         return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_timezone = instance.__dict__.get("timezone")
+        return instance
+
+    def timezone_changed(self):
+        """Whether the timezone differs from the one the user was loaded
+        with; users not loaded from the database count as changed."""
+        loaded = getattr(self, "_loaded_timezone", None)
+        return loaded is None or str(loaded) != str(self.timezone)
+
+    def save(self, *args, **kwargs):
+        self.utc_offset = get_utc_offset(self.timezone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "timezone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "utc_offset"}
+        super().save(*args, **kwargs)
+        self._loaded_timezone = self.timezone
+
+
+def get_utc_offset(tz, at=None):
+    """Returns the UTC offset of `tz` in minutes at `at` (defaults to now)."""
+    at = (at or timezone.now()).astimezone(tz)
+    return int(at.utcoffset().total_seconds()) // 60
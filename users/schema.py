@@ -0,0 +1,8 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """Documents CachedJWTAuthentication as the bearer scheme simplejwt's
+    JWTAuthentication is."""
+
+    target_class = "users.authentication.CachedJWTAuthentication"
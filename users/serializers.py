@@ -1,16 +1,19 @@
 from rest_framework.serializers import ModelSerializer
+from timezone_field.rest_framework import TimeZoneSerializerField
 
+from config.serializers import SparseFieldsMixin
 from users.models import User
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ModelSerializer):
+    timezone = TimeZoneSerializerField(required=False)
 
     class Meta:
         model = User
         fields = "__all__"
 
 
-class UserPublicInfoSerializer(ModelSerializer):
+class UserPublicInfoSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = User
         fields = ("id", "email", "phone", "city", "avatar")
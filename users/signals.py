@@ -0,0 +1,13 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import get_auth_user_key
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_auth_user(sender, instance, **kwargs):
+    """Makes the next request authenticated as the user load it afresh."""
+    cache.delete(get_auth_user_key(instance.pk))
@@ -0,0 +1,177 @@
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import CachedJWTAuthentication
+from users.models import User
+
+
+class UserTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="test@sky.pro", city="Moscow")
+        self.client.force_authenticate(user=self.user)
+
+    def test_sparse_fieldsets(self):
+        other = User.objects.create(email="other@sky.pro", city="Tver")
+
+        response = self.client.get(reverse("users:user-list"), {"fields": "id,city"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [{"id": other.pk, "city": "Tver"}, {"id": self.user.pk, "city": "Moscow"}],
+        )
+
+        response = self.client.get(
+            reverse("users:user-get", args=[self.user.pk]),
+            {"exclude": "password,groups,user_permissions"},
+        )
+        self.assertEqual(response.data["email"], "test@sky.pro")
+        self.assertNotIn("password", response.data)
+
+    def test_user_list_is_paginated_and_filtered(self):
+        for index in range(3):
+            User.objects.create(email=f"user{index}@sky.pro", city="Tver")
+        url = reverse("users:user-list")
+
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(
+            [user["email"] for user in response.data["results"]],
+            ["test@sky.pro", "user0@sky.pro"],
+        )
+        # Only the current user sees their full profile.
+        self.assertIn("tg_chat_id", response.data["results"][0])
+        self.assertNotIn("tg_chat_id", response.data["results"][1])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [user["email"] for user in response.data["results"]],
+            ["user1@sky.pro", "user2@sky.pro"],
+        )
+
+        response = self.client.get(url, {"city": "Tver", "email_prefix": "user1"})
+        self.assertEqual(
+            [user["email"] for user in response.data["results"]], ["user1@sky.pro"]
+        )
+
+    def test_export_users(self):
+        User.objects.create(email="other@sky.pro", city="Tver")
+
+        response = self.client.get(reverse("users:user-export"), {"city": "Tver"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            ["id,email,phone,city", f"{self.user.pk + 1},other@sky.pro,,Tver"],
+        )
+
+    def test_async_retrieve(self):
+        other = User.objects.create(email="other@sky.pro", city="Tver")
+
+        response = self.client.get(reverse("users:user-get-async", args=[other.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            self.client.get(reverse("users:user-get", args=[other.pk])).data,
+        )
+
+        response = self.client.get(reverse("users:user-get-async", args=[self.user.pk]))
+        self.assertEqual(
+            response.data,
+            self.client.get(reverse("users:user-get", args=[self.user.pk])).data,
+        )
+        self.assertIn("groups", response.data)
+
+    def test_cached_jwt_authentication(self):
+        cache.clear()
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        authentication = CachedJWTAuthentication()
+
+        with self.assertNumQueries(1):
+            authentication.authenticate(request)
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate(request)
+        self.assertEqual(user, self.user)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate(request)
+
+    def test_schema_documents_jwt_auth(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+
+        self.assertIn("jwtAuth", schema["components"]["securitySchemes"])
+        self.assertIn(
+            {"jwtAuth": []}, schema["paths"]["/users/{id}/"]["get"]["security"]
+        )
+
+    def test_create_user_in_one_query(self):
+        self.client.logout()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("users:register"),
+                {"email": "new@sky.pro", "password": "secret123"},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        writes = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(
+            User.objects.get(email="new@sky.pro").check_password("secret123")
+        )
+
+    def test_import_users(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(
+                "email,password,city,timezone\n"
+                "one@sky.pro,secret1,Tver,Europe/Moscow\n"
+                "two@sky.pro,,,\n"
+                "test@sky.pro,secret3,Omsk,\n"
+            )
+            file.flush()
+            call_command(
+                "import_users", file.name, batch_size=2, workers=1, stdout=StringIO()
+            )
+
+        one = User.objects.get(email="one@sky.pro")
+        self.assertTrue(one.check_password("secret1"))
+        self.assertEqual((one.city, one.utc_offset), ("Tver", 180))
+        self.assertFalse(User.objects.get(email="two@sky.pro").has_usable_password())
+        # Existing users are left as they are.
+        self.assertEqual(User.objects.get(email="test@sky.pro").city, "Moscow")
+
+    def test_import_users_rejects_invalid_timezone(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write("email,timezone\none@sky.pro,Mars/Olympus_Mons\n")
+            file.flush()
+            with self.assertRaisesMessage(CommandError, "one@sky.pro"):
+                call_command("import_users", file.name, workers=1, stdout=StringIO())
+
+        self.assertFalse(User.objects.filter(email="one@sky.pro").exists())
+
+    def test_import_users_hashes_in_processes(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as file:
+            file.write(
+                '{"email": "one@sky.pro", "password": "secret1"}\n'
+                '{"email": "two@sky.pro", "password": "secret2"}\n'
+            )
+            file.flush()
+            call_command("import_users", file.name, workers=2, stdout=StringIO())
+
+        self.assertTrue(User.objects.get(email="two@sky.pro").check_password("secret2"))
@@ -4,7 +4,8 @@ from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
 from users.apps import UsersConfig
-from users.views import (UserCreateAPIView, UserDestroyAPIView,
+from users.views import (AsyncUserRetrieveAPIView, UserCreateAPIView,
+                         UserDestroyAPIView, UserExportAPIView,
                          UserListAPIView, UserRetrieveAPIView,
                          UserUpdateAPIView)
 
@@ -14,7 +15,13 @@ urlpatterns = [
     # users
     path("register/", UserCreateAPIView.as_view(), name="register"),
     path("", UserListAPIView.as_view(), name="user-list"),
+    path("export/", UserExportAPIView.as_view(), name="user-export"),
     path("<int:pk>/", UserRetrieveAPIView.as_view(), name="user-get"),
+    path(
+        "<int:pk>/async/",
+        AsyncUserRetrieveAPIView.as_view(),
+        name="user-get-async",
+    ),
     path("<int:pk>/update/", UserUpdateAPIView.as_view(), name="user-update"),
     path("<int:pk>/delete/", UserDestroyAPIView.as_view(), name="user-delete"),
     # token
@@ -1,11 +1,23 @@
+import csv
+from itertools import chain
+
+from django.contrib.auth.hashers import make_password
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
-                                     ListAPIView, RetrieveAPIView,
-                                     UpdateAPIView)
+                                     GenericAPIView, ListAPIView,
+                                     RetrieveAPIView, UpdateAPIView)
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from config.serializers import defer_unrequested
+from config.views import AsyncRetrieveAPIView
+from users.filters import UserFilter
+from users.paginations import UserPagination
 from users.serializers import UserPublicInfoSerializer, UserSerializer
 
 from .models import User
@@ -23,9 +35,9 @@ class UserCreateAPIView(CreateAPIView):
     permission_classes = (AllowAny,)
 
     def perform_create(self, serializer):
-        user = serializer.save(is_active=True)
-        user.set_password(user.password)
-        user.save()
+        # Hash the password before saving, so the user is written in one INSERT.
+        password = serializer.validated_data["password"]
+        serializer.save(is_active=True, password=make_password(password))
 
 
 @extend_schema(
@@ -33,22 +45,70 @@ class UserCreateAPIView(CreateAPIView):
     summary="Getting a list of all users",
 )
 class UserListAPIView(ListAPIView):
-    """Outputs a list of all users."""
+    """Outputs a page of users, filtered by city or email prefix."""
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = UserPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = UserFilter
+
+    def get_queryset(self):
+        return defer_unrequested(
+            super().get_queryset(), self.request, UserSerializer().fields
+        )
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        data = []
-        for user in queryset:
-            if request.user == user:
-                serializer = self.get_serializer(user)
-            else:
-                serializer = UserPublicInfoSerializer(user)
-            data.append(serializer.data)
-        return Response(data)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        # Everybody is shown by their public info, except the current user,
+        # who gets their full profile.
+        data = UserPublicInfoSerializer(
+            page, many=True, context=self.get_serializer_context()
+        ).data
+        for index, user in enumerate(page):
+            if user.pk == request.user.pk:
+                data[index] = self.get_serializer(user).data
+        return self.get_paginated_response(data)
+
+
+class Echo:
+    """File-like object handing each written row straight back."""
+
+    def write(self, value):
+        return value
+
+
+@extend_schema(
+    tags=["Users"],
+    summary="Exporting users as CSV",
+)
+class UserExportAPIView(GenericAPIView):
+    """Streams the public info of all users, filtered like the list, as CSV.
+
+    Rows are read in chunks from a server-side cursor, so memory use does
+    not grow with the number of users.
+    """
+
+    queryset = User.objects.all()
+    permission_classes = (IsAuthenticated,)
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = UserFilter
+    fields = ("id", "email", "phone", "city")
+
+    @extend_schema(responses={(200, "text/csv"): OpenApiTypes.STR})
+    def get(self, request, *args, **kwargs):
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .values_list(*self.fields)
+            .iterator(chunk_size=2000)
+        )
+        writer = csv.writer(Echo())
+        return StreamingHttpResponse(
+            chain([writer.writerow(self.fields)], map(writer.writerow, rows)),
+            content_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="users.csv"'},
+        )
 
 
 @extend_schema(
@@ -62,12 +122,50 @@ class UserRetrieveAPIView(RetrieveAPIView):
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
 
+    def get_queryset(self):
+        return defer_unrequested(
+            super().get_queryset(), self.request, UserSerializer().fields
+        )
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         if request.user == instance:
             serializer = self.get_serializer(instance)
         else:
-            serializer = UserPublicInfoSerializer(instance)
+            serializer = UserPublicInfoSerializer(
+                instance, context=self.get_serializer_context()
+            )
+        return Response(serializer.data)
+
+
+@extend_schema(
+    tags=["Users"],
+    summary="Detailed user information (async)",
+)
+class AsyncUserRetrieveAPIView(AsyncRetrieveAPIView):
+    """UserRetrieveAPIView for ASGI servers, reading through the async ORM."""
+
+    serializer_class = UserSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        queryset = defer_unrequested(
+            User.objects.all(), self.request, UserSerializer().fields
+        )
+        if self.kwargs["pk"] == self.request.user.pk:
+            # The full profile lists groups and permissions; load them along
+            # with the user, as rendering must not query.
+            queryset = queryset.prefetch_related("groups", "user_permissions")
+        return queryset
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await aget_object_or_404(self.get_queryset(), pk=self.kwargs["pk"])
+        if request.user == instance:
+            serializer = self.get_serializer(instance)
+        else:
+            serializer = UserPublicInfoSerializer(
+                instance, context=self.get_serializer_context()
+            )
         return Response(serializer.data)
 
 